@@ -4,39 +4,259 @@ import os
 import argparse
 import time
 import tempfile
+import atexit
+import json
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import RNA  # ViennaRNA Python bindings, used for in-process folding when available
+except ImportError:
+    RNA = None
+
+###############################################################################
+# Persistent tool processes — many inputs streamed over one stdin
+###############################################################################
+
+class StreamedProcess:
+    """
+    One long-lived tool process that answers every input written to its stdin
+    with output lines, in order (RNAfold, RNAinverse). A reader thread moves the
+    output lines to a queue so that waits can time out. Any failure kills the
+    process and the next input starts a new one.
+    Subclasses set `command` and define _encode (text written for one input) and
+    _parse (result of one output line, None for lines to skip).
+    """
+    command = None
+
+    def __init__(self):
+        self.proc = None
+
+    def _encode(self, item):
+        raise NotImplementedError
+
+    def _parse(self, line, item):
+        raise NotImplementedError
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1
+        )
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read, args=(self.proc, self.lines), daemon=True).start()
+
+    @staticmethod
+    def _read(proc, lines):
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    @staticmethod
+    def _write(proc, text):
+        try:
+            proc.stdin.write(text)
+            proc.stdin.flush()
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        if self.proc is not None:
+            if self.proc.poll() is None:
+                self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def run(self, items, timeout_sec=10, per_item=False):
+        """
+        Results of a batch of inputs, in order.
+        With per_item, every input gets timeout_sec from the previous answer; otherwise
+        the whole batch shares one deadline. An input that times out fails, as do the
+        unanswered ones of a batch deadline. When the process dies or times out, the
+        input it was on fails and the rest go to a restarted process.
+        Outputs:
+            list of (result_or_None, success_bool)
+        """
+        results = []
+        deadline = time.time() + timeout_sec
+        while len(results) < len(items):
+            if self.proc is None or self.proc.poll() is not None:
+                self.close()
+                try:
+                    self._start()
+                except OSError:
+                    return results + [(None, False)] * (len(items) - len(results))
+            todo = items[len(results):]
+            # Written from a thread: a hung process must not block us past the deadline
+            threading.Thread(target=self._write, args=(self.proc, "".join(map(self._encode, todo))),
+                             daemon=True).start()
+            for item in todo:
+                if per_item:
+                    deadline = time.time() + timeout_sec
+                result = self._next_result(item, deadline)
+                if result is None:
+                    break
+                results.append((result, True))
+            else:
+                continue
+            self.close()
+            if not per_item and time.time() >= deadline:
+                return results + [(None, False)] * (len(items) - len(results))
+            results.append((None, False))
+        return results
+
+    def _next_result(self, item, deadline):
+        """Parsed answer to `item`, or None on timeout / process exit."""
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                return None
+            if line is None:
+                return None
+            result = self._parse(line, item)
+            if result is not None:
+                return result
+
+
+class StreamPool:
+    """
+    Pool of StreamedProcesses shared by all threads, started on demand up to `size`.
+    A caller takes an idle process (or waits for one); a batch is split into one
+    contiguous chunk per process, run concurrently.
+    Attributes:
+        factory: callable - Creates one StreamedProcess
+        size: int - Maximum number of processes
+    """
+    def __init__(self, factory, size=2):
+        self.factory = factory
+        self.size = size
+        self.idle = queue.Queue()
+        self.started = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self.idle.empty() and self.started < self.size:
+                self.started += 1
+                return self.factory()
+        return self.idle.get()
+
+    def _run_chunk(self, items, timeout_sec, per_item):
+        process = self._acquire()
+        try:
+            return process.run(items, timeout_sec, per_item)
+        finally:
+            self.idle.put(process)
+
+    def run(self, items, timeout_sec=10, per_item=False):
+        """Results of a batch, in order (see StreamedProcess.run)."""
+        items = list(items)
+        if len(items) <= 1 or self.size == 1:
+            return self._run_chunk(items, timeout_sec, per_item) if items else []
+        step = -(-len(items) // self.size)
+        chunks = [items[i:i + step] for i in range(0, len(items), step)]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            done = pool.map(self._run_chunk, chunks, [timeout_sec] * len(chunks), [per_item] * len(chunks))
+            return [r for chunk in done for r in chunk]
+
+    def close(self):
+        with self._lock:
+            started, self.started = self.started, 0
+        for _ in range(started):
+            self.idle.get().close()
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def stream_pool(name, factory, size):
+    """
+    Shared StreamPool of this process for one tool, created on first use and closed at exit.
+    A later call with a larger size raises the pool's size (it never shrinks).
+    """
+    with _POOLS_LOCK:
+        if name not in _POOLS:
+            _POOLS[name] = StreamPool(factory, size)
+            atexit.register(_POOLS[name].close)
+        pool = _POOLS[name]
+    with pool._lock:
+        pool.size = max(pool.size, size)
+    return pool
+
 
 ###############################################################################
 # Tool runners — each returns (sequence_or_None, success_bool)
 ###############################################################################
 
+ACGU = set("ACGU")
+
+
+class RNAinverseProcess(StreamedProcess):
+    """
+    Long-lived `RNAinverse -R-1` fed one target per input: the structure, then
+    an empty start sequence line (random start). Answers "SEQUENCE distance".
+    """
+    command = ['RNAinverse', '-R-1']
+
+    def _encode(self, structure):
+        return structure + "\n\n"
+
+    def _parse(self, line, structure):
+        parts = line.split()
+        if parts and len(parts[0]) == len(structure) and set(parts[0]) <= ACGU:
+            return parts[0]
+        return None
+
+
+class RNAinverseSearchProcess(RNAinverseProcess):
+    """
+    Long-lived plain `RNAinverse` (one search per target): answers every target with
+    the best sequence it found, also when that sequence does not fold into the target.
+    """
+    command = ['RNAinverse']
+
+
+# RNAinverse processes kept per caller process (the experiment scripts run 8 threads)
+RNAINVERSE_PROCESSES = 8
+
+
+def rnainverse_pool(size=None):
+    """Shared pool of up to max(size, RNAINVERSE_PROCESSES) RNAinverse processes (started on demand)."""
+    return stream_pool("RNAinverse", RNAinverseProcess, max(size or 0, RNAINVERSE_PROCESSES))
+
+
+def run_rnainverse_batch(structures, timeout_sec=30):
+    """
+    Runs RNAinverse on many targets (repeats allowed, e.g. 10 trials of one structure)
+    through the persistent processes of rnainverse_pool(); each target gets timeout_sec.
+    Outputs:
+        list of (sequence_or_None, success_bool), in order
+    """
+    return rnainverse_pool().run(structures, timeout_sec, per_item=True)
+
+
 def run_rnainverse(structure, timeout_sec=30):
     """
     Runs ViennaRNA RNAinverse on a dot-bracket structure.
     RNAinverse uses stochastic local search to find a sequence
-    whose MFE fold matches the target structure.
+    whose MFE fold matches the target structure. The target is streamed to
+    a persistent RNAinverse process (no fork/exec per call).
     """
-    try:
-        proc = subprocess.Popen(
-            ['RNAinverse', '-R-1'],
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            text=True
-        )
-        try:
-            stdout, _ = proc.communicate(input=structure + "\n", timeout=timeout_sec)
-        except subprocess.TimeoutExpired:
-            proc.kill(); proc.communicate()
-            return None, False
-        if proc.returncode != 0:
-            return None, False
-        lines = stdout.strip().split('\n')
-        if not lines or not lines[0]:
-            return None, False
-        parts = lines[0].split()
-        if parts and len(parts[0]) == len(structure) and all(c in 'ACGU' for c in parts[0]):
-            return parts[0], True
-        return None, False
-    except Exception:
-        return None, False
+    return run_rnainverse_batch([structure], timeout_sec)[0]
+
+
+def run_rnainverse_search(structure, timeout_sec=10):
+    """
+    Runs one plain RNAinverse search on a dot-bracket structure and returns its best
+    sequence, exact or not (run_rnainverse only returns exact solutions). The target
+    is streamed to a persistent process of a shared pool, like run_rnainverse.
+    """
+    pool = stream_pool("RNAinverse search", RNAinverseSearchProcess, RNAINVERSE_PROCESSES)
+    return pool.run([structure], timeout_sec)[0]
 
 
 def run_nemo(structure, timeout_sec=30):
@@ -169,61 +389,161 @@ def run_learna(structure, timeout_sec=60):
         return None, False
 
 
-def run_nupack(structure, timeout_sec=60):
+NUPACK_PYTHON = "/usr/bin/python3"  # System python3, the one with nupack installed
+NUPACK_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nupack_worker.py")
+
+
+class NupackWorker:
     """
-    Runs NUPACK 4.0 Design on a dot-bracket structure.
-    Executes in a subprocess using Python 3 to ensure the nupack module is found.
+    One long-lived nupack_worker.py process: nupack is imported once at start,
+    then design jobs go over its stdin/stdout pipe, one JSON line each way.
+    A reader thread moves the replies to a queue so that waits can time out.
     """
-    script = f'''
-import sys
-try:
-    import nupack
-    config = nupack.Model(material="rna")
-    domain = nupack.Domain("N" * {len(structure)}, name="d1")
-    strand = nupack.TargetStrand([domain], name="s1")
-    complex_target = nupack.TargetComplex([strand], "{structure}", name="c1")
-    tube = nupack.TargetTube(on_targets={{complex_target: 1e-6}}, name="t1")
-    design = nupack.Design(tubes=[tube], model=config)
-    results = design.run(trials=1)
-    
-    if results:
-        seq = None
+    def __init__(self, start_timeout=120):
+        self.proc = subprocess.Popen(
+            [NUPACK_PYTHON, NUPACK_WORKER],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1
+        )
+        self.replies = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+        reply = self._reply(start_timeout)
+        if not reply or not reply.get("ready"):
+            self.close()
+            raise RuntimeError(f"NUPACK worker failed to start: {(reply or {}).get('error', 'no reply')}")
+
+    def _read(self):
+        for line in self.proc.stdout:
+            self.replies.put(line)
+        self.replies.put(None)
+
+    def _reply(self, timeout):
+        """Next JSON reply, or None on timeout / worker exit."""
         try:
-            for d_obj, d_seq in results[0].domains.items():
-                if len(str(d_seq)) == {len(structure)}:
-                    seq = str(d_seq)
-                    break
+            line = self.replies.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if line is None:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def design(self, structure, timeout_sec):
+        """
+        Returns (sequence_or_None, success_bool, worker_alive_bool).
+        A job that times out kills the worker: its design cannot be interrupted otherwise.
+        """
+        try:
+            self.proc.stdin.write(json.dumps({"structure": structure}) + "\n")
+            self.proc.stdin.flush()
+        except OSError:
+            self.close()
+            return None, False, False
+        reply = self._reply(timeout_sec)
+        if reply is None:
+            self.close()
+            return None, False, False
+        seq = reply.get("seq")
+        return (seq, True, True) if seq else (None, False, True)
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+class NupackPool:
+    """
+    Pool of warm NupackWorkers shared by all threads. A job waits for an idle
+    worker; a worker killed by a timeout is replaced in the background, so its
+    start-up counts neither toward the job that timed out nor the next one.
+    Attributes:
+        size: int - Number of worker slots
+        idle: queue.Queue - Idle workers (None for a slot whose worker failed to restart)
+    """
+    def __init__(self, size=2):
+        self.size = size
+        self.idle = queue.Queue()
+        # Workers import nupack concurrently; if one fails to start, the others are closed
+        with ThreadPoolExecutor(max_workers=size) as pool:
+            futures = [pool.submit(NupackWorker) for _ in range(size)]
+        try:
+            for future in futures:
+                self.idle.put(future.result())
         except Exception:
-            pass
-        
-        if not seq:
+            for future in futures:
+                if future.exception() is None:
+                    future.result().close()
+            raise
+
+    def _replace(self):
+        try:
+            worker = NupackWorker()
+        except Exception as e:
+            print(f"[DEBUG] NUPACK worker restart failed: {e}")
+            worker = None
+        self.idle.put(worker)
+
+    def design(self, structure, timeout_sec=60):
+        """Same (seq, ok) contract and timeout as run_nupack."""
+        worker = self.idle.get()
+        if worker is None:
+            # Restart failed earlier: try again, inline this time
             try:
-                analysis = results[0].to_analysis()
-                for s_name in analysis.strands:
-                    seq = str(analysis.strands[s_name])
-                    break
+                worker = NupackWorker()
             except Exception:
-                pass
-                
-        if seq and len(seq) == {len(structure)} and all(c in "ACGU" for c in seq):
-            print("NUPACK_SEQ:" + seq)
-except Exception as e:
-    print("NUPACK_ERROR:", e, file=sys.stderr)
-'''
+                self.idle.put(None)
+                return None, False
+        try:
+            seq, ok, alive = worker.design(structure, timeout_sec)
+        except Exception:
+            worker.close()
+            seq, ok, alive = None, False, False
+        if alive:
+            self.idle.put(worker)
+        else:
+            threading.Thread(target=self._replace, daemon=True).start()
+        return seq, ok
+
+    def close(self):
+        for _ in range(self.size):
+            worker = self.idle.get()
+            if worker is not None:
+                worker.close()
+        self.size = 0
+
+
+_NUPACK_POOL = None
+_NUPACK_LOCK = threading.Lock()
+
+
+def nupack_pool(size=None):
+    """
+    Shared NupackPool of this process, started (and warmed up) on first use.
+    Call it before timing anything to keep NUPACK start-up out of the measured times.
+    Inputs:
+        size: int or None - Number of workers if the pool is not started yet (default TOOL_LIMITS["NUPACK"])
+    """
+    global _NUPACK_POOL
+    with _NUPACK_LOCK:
+        if _NUPACK_POOL is None or _NUPACK_POOL.size == 0:
+            _NUPACK_POOL = NupackPool(size or TOOL_LIMITS.get("NUPACK", 2))
+            atexit.register(_NUPACK_POOL.close)
+        return _NUPACK_POOL
+
+
+def run_nupack(structure, timeout_sec=60):
+    """
+    Runs NUPACK 4.0 Design on a dot-bracket structure.
+    Jobs go to the persistent worker pool of nupack_pool(), so nupack is imported
+    once per worker rather than once per structure.
+    """
     try:
-        # Run using the system python3 which has nupack installed
-        res = subprocess.run(
-            ["/usr/bin/python3", "-c", script], 
-            capture_output=True, text=True, timeout=timeout_sec
-        )
-        for line in res.stdout.splitlines():
-            if line.startswith("NUPACK_SEQ:"):
-                return line.split("NUPACK_SEQ:")[1].strip(), True
-        return None, False
-    except subprocess.TimeoutExpired:
-        return None, False
+        return nupack_pool().design(structure, timeout_sec)
     except Exception as e:
-        print(f"[DEBUG] Subprocess NUPACK error: {e}")
+        print(f"[DEBUG] NUPACK worker error: {e}")
         return None, False
 
 def parseSS(s):
@@ -268,7 +588,48 @@ def calculate_hamming_distance(s1, s2):
 # Verification — RNAfold
 ###############################################################################
 
-def run_rnafold(sequence, timeout_sec=10):
+# Model settings of the in-process folds, as RNA.md attributes (empty: RNAfold defaults)
+RNAFOLD_SETTINGS = {}
+_MODEL_DETAILS = {}
+
+
+def model_details(settings=None):
+    """
+    RNA.md model details for a settings dict (e.g. {"uniq_ML": 1}), built once per settings.
+    Inputs:
+        settings: dict or None - RNA.md attributes to set (default RNAFOLD_SETTINGS)
+    Outputs:
+        RNA.md - Shared, do not modify
+    """
+    settings = RNAFOLD_SETTINGS if settings is None else settings
+    key = tuple(sorted(settings.items()))
+    md = _MODEL_DETAILS.get(key)
+    if md is None:
+        md = RNA.md()
+        for name, value in key:
+            setattr(md, name, value)
+        _MODEL_DETAILS[key] = md
+    return md
+
+
+def fold_backend():
+    """"bindings" when the ViennaRNA Python bindings can be imported, "binary" (RNAfold) otherwise."""
+    return "bindings" if RNA is not None else "binary"
+
+
+def fold_in_process(sequence, settings=None):
+    """
+    MFE structure of a sequence with the ViennaRNA Python bindings (no subprocess).
+    Returns (structure_or_None, success_bool), like run_rnafold.
+    """
+    try:
+        structure, _ = RNA.fold_compound(sequence, model_details(settings)).mfe()
+        return structure, True
+    except Exception:
+        return None, False
+
+
+def run_rnafold_binary(sequence, timeout_sec=10):
     """
     Runs ViennaRNA RNAfold on a sequence.
     Returns the MFE secondary structure.
@@ -296,11 +657,178 @@ def run_rnafold(sequence, timeout_sec=10):
         return None, False
 
 
+FOLD_CHARS = set("().")
+
+
+class RNAfoldProcess(StreamedProcess):
+    """
+    Long-lived `RNAfold --noPS`: answers every sequence with its echo and a
+    "structure (energy)" line.
+    """
+    command = ['RNAfold', '--noPS']
+
+    def _encode(self, sequence):
+        return sequence + "\n"
+
+    def _parse(self, line, sequence):
+        parts = line.split()
+        if parts and len(parts[0]) == len(sequence) and set(parts[0]) <= FOLD_CHARS:
+            return parts[0]
+        return None
+
+
+RNAFOLD_PROCESSES = 2
+
+
+def rnafold_pool(size=None):
+    """Shared pool of up to max(size, RNAFOLD_PROCESSES) RNAfold processes (started on demand)."""
+    return stream_pool("RNAfold", RNAfoldProcess, max(size or 0, RNAFOLD_PROCESSES))
+
+
+def run_rnafold(sequence, timeout_sec=10):
+    """
+    MFE secondary structure of a sequence: in process with the ViennaRNA bindings
+    when they are installed (RNAFOLD_SETTINGS model), otherwise through the
+    persistent RNAfold processes of rnafold_pool().
+    Returns (structure_or_None, success_bool).
+    """
+    if RNA is not None:
+        return fold_in_process(sequence)
+    return rnafold_pool().run([sequence], timeout_sec)[0]
+
+
+def fold_sequences(sequences, timeout_sec=10):
+    """
+    MFE structures of many sequences, in order (see run_rnafold).
+    In process, thousands of sequences are folded without any fork/exec; with the
+    binary, the whole batch is streamed through the pooled RNAfold processes
+    and timeout_sec applies to the batch.
+    Outputs:
+        list of (structure_or_None, success_bool)
+    """
+    if RNA is not None:
+        return [fold_in_process(seq) for seq in sequences]
+    return rnafold_pool().run(sequences, timeout_sec)
+
+
+###############################################################################
+# Job scheduler — every (structure, tool) pair is one job
+###############################################################################
+
+TOOLS = ["Baseline", "RNAinverse", "NEMO", "eM2dRNAs", "DesiRNA", "LEARNA", "NUPACK"]
+TOOL_FUNCS = {
+    "Baseline": run_baseline,
+    "RNAinverse": run_rnainverse,
+    "NEMO": run_nemo,
+    "eM2dRNAs": run_em2drnas,
+    "DesiRNA": run_desirna,
+    "LEARNA": run_learna,
+    "NUPACK": run_nupack,
+}
+# Heavy tools use several cores or a lot of memory per run: at most this many run at once
+TOOL_LIMITS = {"DesiRNA": 2, "LEARNA": 1, "NUPACK": 2}
+
+
+def run_job(structure, tool_name):
+    """
+    Designs a sequence for one structure with one tool and verifies it with RNAfold.
+    Returns (result dict, log line); the time only covers the design, not the verification.
+    """
+    t0 = time.time()
+    seq, ok = TOOL_FUNCS[tool_name](structure)
+    elapsed = time.time() - t0
+
+    if ok and seq:
+        mfe, fold_ok = run_rnafold(seq)
+        if fold_ok and mfe:
+            match = (mfe == structure)
+            dist = 0 if match else calculate_hamming_distance(structure, mfe)
+            line = f"  {tool_name:12s}: {seq[:30]}... → MFE match: {'YES' if match else 'NO'} ({elapsed:.1f}s, dist={dist})"
+            return {"seq": seq, "mfe": mfe, "match": match, "time": elapsed, "dist": dist}, line
+        line = f"  {tool_name:12s}: seq found but RNAfold failed ({elapsed:.1f}s)"
+        return {"seq": seq, "mfe": None, "match": False, "time": elapsed, "dist": None}, line
+    line = f"  {tool_name:12s}: FAILED ({elapsed:.1f}s)"
+    return {"seq": None, "mfe": None, "match": False, "time": elapsed, "dist": None}, line
+
+
+def run_jobs(lines, tools, workers=None, tool_limits=None, on_structure=None):
+    """
+    Runs every (structure, tool) job on a bounded thread pool (the tools are
+    subprocesses, so threads are enough to keep all cores busy).
+    Jobs start in structure-major order; a job of a tool listed in tool_limits
+    only starts while fewer than its limit of that tool are running, and the free
+    slot goes to the next job of another tool meanwhile.
+    Inputs:
+        lines: list of str - Target structures
+        tools: list of str - Tool names (keys of TOOL_FUNCS)
+        workers: int or None - Jobs running at once (None: one per core, 1: sequential)
+        tool_limits: dict or None - Tool name -> maximum concurrent jobs of that tool (default TOOL_LIMITS)
+        on_structure: callable or None - Called as on_structure(i, log lines) for every
+            structure, in order, as soon as all its jobs are done
+    Outputs:
+        list of dict - results[i][tool] = result dict of run_job
+    Raises ValueError if a tool limit is below 1 (its jobs could never start).
+    """
+    workers = workers or os.cpu_count() or 1
+    limits = TOOL_LIMITS if tool_limits is None else tool_limits
+    bad = {t: n for t, n in limits.items() if n < 1}
+    if bad:
+        raise ValueError(f"Tool limits must be at least 1, got {bad}")
+    if "RNAinverse" in tools:
+        # One process per concurrent RNAinverse job, so no timed job waits for a free process
+        rnainverse_pool(min(workers, limits.get("RNAinverse", workers)))
+    if RNA is None:
+        # Every job verifies its sequence with RNAfold: one process per job running at once
+        rnafold_pool(workers)
+    pending = [(i, t) for i in range(len(lines)) for t in tools]
+    results = [{} for _ in lines]
+    logs = [{} for _ in lines]
+    running = {t: 0 for t in tools}
+    reported = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        while pending or in_flight:
+            # Fill free slots with the earliest jobs whose tool is under its limit
+            i_job = 0
+            while len(in_flight) < workers and i_job < len(pending):
+                i, t = pending[i_job]
+                if running[t] < limits.get(t, workers):
+                    del pending[i_job]
+                    running[t] += 1
+                    in_flight[pool.submit(run_job, lines[i], t)] = (i, t)
+                else:
+                    i_job += 1
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, t = in_flight.pop(future)
+                running[t] -= 1
+                results[i][t], logs[i][t] = future.result()
+            while reported < len(lines) and len(results[reported]) == len(tools):
+                if on_structure is not None:
+                    on_structure(reported, [logs[reported][t] for t in tools])
+                reported += 1
+    return results
+
+
 ###############################################################################
 # Main benchmark loop
 ###############################################################################
 
-def benchmark_file(filepath, max_structures=10):
+def benchmark_file(filepath, max_structures=10, workers=None, tool_limits=None, tools=None):
+    """
+    Benchmarks every tool on the structures of a file, with RNAfold verification.
+    The (structure, tool) jobs run in parallel (see run_jobs); the summary table and
+    the _benchmark.txt file are the same as for a sequential run. Times are per job,
+    so on a loaded machine they may be somewhat longer than in a sequential run.
+    Inputs:
+        filepath: str - File with one dot-bracket structure per line (optionally ",count")
+        max_structures: int or None - Only test the first structures
+        workers: int or None - Jobs running at once (None: one per core, 1: sequential)
+        tool_limits: dict or None - Tool name -> maximum concurrent jobs (default TOOL_LIMITS)
+        tools: list of str or None - Tools to benchmark, in table order (default TOOLS)
+    """
+    tools = TOOLS if tools is None else tools
     if not os.path.exists(filepath):
         print(f"Error: File '{filepath}' not found.")
         return
@@ -334,17 +862,6 @@ def benchmark_file(filepath, max_structures=10):
     total = len(lines)
     print(f"Structures to test: {total}\n")
 
-    TOOLS = ["Baseline", "RNAinverse", "NEMO", "eM2dRNAs", "DesiRNA", "LEARNA", "NUPACK"]
-    tool_funcs = {
-        "Baseline": run_baseline,
-        "RNAinverse": run_rnainverse,
-        "NEMO": run_nemo,
-        "eM2dRNAs": run_em2drnas,
-        "DesiRNA": run_desirna,
-        "LEARNA": run_learna,
-        "NUPACK": run_nupack,
-    }
-
     # Stats tracking
     stats = {t: {
         "designed": 0, 
@@ -353,50 +870,38 @@ def benchmark_file(filepath, max_structures=10):
         "times_failure": [], 
         "total_time": 0.0,
         "distances_failure": []
-    } for t in TOOLS}
-    all_results = []
+    } for t in tools}
 
-    for i, structure in enumerate(lines):
+    def report(i, log_lines):
+        structure = lines[i]
         print(f"[{i+1}/{total}] Target (len={len(structure)}): {structure}")
-        struct_result = {"target": structure, "tools": {}}
+        for line in log_lines:
+            print(line)
+        print()
 
-        for tool_name in TOOLS:
-            t0 = time.time()
-            seq, ok = tool_funcs[tool_name](structure)
-            elapsed = time.time() - t0
-            stats[tool_name]["total_time"] += elapsed
+    if "NUPACK" in tools:
+        # Start the NUPACK workers now, so that their start-up is not timed
+        try:
+            nupack_pool((TOOL_LIMITS if tool_limits is None else tool_limits).get("NUPACK"))
+        except Exception as e:
+            print(f"[DEBUG] NUPACK workers unavailable: {e}")
+    results = run_jobs(lines, tools, workers, tool_limits, on_structure=report)
 
-            if ok and seq:
+    all_results = []
+    for structure, tool_results in zip(lines, results):
+        for tool_name in tools:
+            tr = tool_results[tool_name]
+            stats[tool_name]["total_time"] += tr["time"]
+            if tr["seq"]:
                 stats[tool_name]["designed"] += 1
-                mfe, fold_ok = run_rnafold(seq)
-                if fold_ok and mfe:
-                    match = (mfe == structure)
-                    dist = 0 if match else calculate_hamming_distance(structure, mfe)
-                    
-                    if match:
-                        stats[tool_name]["verified"] += 1
-                        stats[tool_name]["times_success"].append(elapsed)
-                    else:
-                        stats[tool_name]["times_failure"].append(elapsed)
-                        stats[tool_name]["distances_failure"].append(dist)
-                        
-                    print(f"  {tool_name:12s}: {seq[:30]}... → MFE match: {'YES' if match else 'NO'} ({elapsed:.1f}s, dist={dist})")
-                    struct_result["tools"][tool_name] = {
-                        "seq": seq, "mfe": mfe, "match": match, "time": elapsed, "dist": dist
-                    }
+            if tr["mfe"]:
+                if tr["match"]:
+                    stats[tool_name]["verified"] += 1
+                    stats[tool_name]["times_success"].append(tr["time"])
                 else:
-                    print(f"  {tool_name:12s}: seq found but RNAfold failed ({elapsed:.1f}s)")
-                    struct_result["tools"][tool_name] = {
-                        "seq": seq, "mfe": None, "match": False, "time": elapsed, "dist": None
-                    }
-            else:
-                print(f"  {tool_name:12s}: FAILED ({elapsed:.1f}s)")
-                struct_result["tools"][tool_name] = {
-                    "seq": None, "mfe": None, "match": False, "time": elapsed, "dist": None
-                }
-
-        all_results.append(struct_result)
-        print()
+                    stats[tool_name]["times_failure"].append(tr["time"])
+                    stats[tool_name]["distances_failure"].append(tr["dist"])
+        all_results.append({"target": structure, "tools": tool_results})
 
     # Print summary table
     print("=" * 120)
@@ -405,7 +910,7 @@ def benchmark_file(filepath, max_structures=10):
     header = f"{'Tool':<14} {'Designed':>10} {'Verified':>10} {'Match Rate':>12} {'Avg T(S)':>10} {'Avg T(F)':>10} {'Avg T(A)':>10} {'Avg D(F)':>10}"
     print(header)
     print("-" * len(header))
-    for t in TOOLS:
+    for t in tools:
         d = stats[t]["designed"]
         v = stats[t]["verified"]
         rate = f"{v}/{total} ({v/total*100:.0f}%)" if total > 0 else "N/A"
@@ -426,7 +931,7 @@ def benchmark_file(filepath, max_structures=10):
 
         f.write(f"{'Tool':<14} {'Designed':>10} {'Verified':>10} {'Match Rate':>12} {'Avg T(S)':>10} {'Avg T(F)':>10} {'Avg T(A)':>10} {'Avg D(F)':>10}\n")
         f.write("-" * 100 + "\n")
-        for t in TOOLS:
+        for t in tools:
             d = stats[t]["designed"]
             v = stats[t]["verified"]
             rate = f"{v}/{total} ({v/total*100:.0f}%)" if total > 0 else "N/A"
@@ -440,7 +945,7 @@ def benchmark_file(filepath, max_structures=10):
 
         for r in all_results:
             f.write(f"Target: {r['target']}\n")
-            for t in TOOLS:
+            for t in tools:
                 tr = r["tools"][t]
                 if tr["seq"]:
                     f.write(f"  {t}:\n")
@@ -464,5 +969,24 @@ if __name__ == "__main__":
     )
     parser.add_argument("filepath", help="Path to file with dot-bracket structures")
     parser.add_argument("--max", type=int, default=None, help="Max structures to test (default: All)")
+    parser.add_argument("--workers", type=int, default=None, help="Jobs running at once (default: one per core, 1: sequential)")
+    parser.add_argument("--tool-limit", action="append", default=[], metavar="TOOL=N",
+                        help="Max concurrent jobs of one tool, repeatable (default: DesiRNA=2 LEARNA=1 NUPACK=2)")
+    parser.add_argument("--tools", default=None, metavar="TOOL,...",
+                        help=f"Comma-separated tools to benchmark (default: all of {','.join(TOOLS)})")
     args = parser.parse_args()
-    benchmark_file(args.filepath, args.max)
+    tools = None
+    if args.tools is not None:
+        tools = [t for t in args.tools.split(",") if t]
+        unknown = [t for t in tools if t not in TOOLS]
+        if unknown or not tools:
+            parser.error(f"--tools expects names from {', '.join(TOOLS)}, got {args.tools!r}")
+    tool_limits = dict(TOOL_LIMITS)
+    for item in args.tool_limit:
+        name, _, n = item.partition("=")
+        if name not in TOOLS:
+            parser.error(f"--tool-limit: unknown tool {name!r} in {item!r} (tools: {', '.join(TOOLS)})")
+        if not n.isdigit() or int(n) < 1:
+            parser.error(f"--tool-limit expects TOOL=N with an integer N >= 1, got {item!r}")
+        tool_limits[name] = int(n)
+    benchmark_file(args.filepath, args.max, args.workers, tool_limits, tools)
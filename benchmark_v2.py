@@ -2,7 +2,6 @@ import os
 import sys
 import time
 import json
-import subprocess
 from datetime import datetime
 
 # Add current directory to path
@@ -25,13 +24,9 @@ def verify_sequence(target_struct, sequence):
     if not sequence:
         return False, None
     try:
-        # RNAfold to check MFE
-        cmd = ["RNAfold"]
-        res = subprocess.run(cmd, input=sequence, capture_output=True, text=True, timeout=5)
-        # Output format: sequence\nstructure (energy)
-        lines = res.stdout.strip().split('\n')
-        if len(lines) >= 2:
-            mfe_struct = lines[1].split()[0]
+        # MFE check: in process with the ViennaRNA bindings if installed, RNAfold otherwise
+        mfe_struct, ok = benchmark_tools.run_rnafold(sequence, timeout_sec=5)
+        if ok and mfe_struct:
             return mfe_struct == target_struct, mfe_struct
         return False, None
     except Exception as e:
@@ -1,12 +1,12 @@
 import sys
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from benchmark_tools import run_rnainverse, run_rnafold
+from benchmark_tools import run_rnainverse_batch, run_rnafold
 
 def get_stats_for_structure(s):
     results = [] # List of (design_ok, match_ok)
-    for _ in range(10):
-        seq, ok = run_rnainverse(s, timeout_sec=5)
+    # The 10 trials are streamed to the persistent RNAinverse processes as one batch
+    for seq, ok in run_rnainverse_batch([s] * 10, timeout_sec=5):
         if ok and seq:
             mfe, fold_ok = run_rnafold(seq)
             match = (fold_ok and mfe == s)
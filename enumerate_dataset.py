@@ -0,0 +1,81 @@
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_structures import enumeration_ranges, iter_all_structures
+
+def part_path(scratch_dir, part):
+    return os.path.join(scratch_dir, f"{part:05d}.txt")
+
+def write_part(n, h, theta, part, start, stop, scratch_dir):
+    """
+    Writes the structures of length n with index in [start, stop) to their part file.
+    Outputs:
+        int - Number of structures written
+    """
+    path = part_path(scratch_dir, part)
+    written = 0
+    with open(path + ".tmp", "w") as f:
+        for s in iter_all_structures(n, {}, h, theta, start, stop):
+            f.write(s + "\n")
+            written += 1
+    os.replace(path + ".tmp", path)
+    return written
+
+def _write_part(task):
+    return write_part(*task)
+
+def enumerate_dataset(n, h, theta, out_file, workers=None, parts=None):
+    """
+    Writes every structure of length n (h, theta grammar) to out_file, each exactly once.
+    The index space is split into contiguous ranges written by a process pool and the
+    parts are concatenated in order, so the file does not depend on the number of workers.
+    The parts are written to a scratch directory of this run (next to out_file), so
+    runs into the same directory do not share them.
+    Inputs:
+        n: int - Length of the structures
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        out_file: str - Output file, one structure per line
+        workers: int or None - Number of processes (None: one per core, 1: no pool)
+        parts: int or None - Number of index ranges (default: 4 per worker)
+    Outputs:
+        int - Number of structures written
+    """
+    out_dir = os.path.dirname(out_file) or "."
+    if parts is None:
+        parts = 4 * (workers or os.cpu_count() or 1)
+    ranges = enumeration_ranges(n, {}, h, theta, parts)
+    scratch_dir = tempfile.mkdtemp(prefix=".parts-", dir=out_dir)
+    try:
+        tasks = [(n, h, theta, part, start, stop, scratch_dir) for part, (start, stop) in enumerate(ranges)]
+        if workers == 1:
+            written = list(map(_write_part, tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                written = list(pool.map(_write_part, tasks))
+
+        with open(out_file, "wb") as out:
+            for part in range(len(tasks)):
+                with open(part_path(scratch_dir, part), "rb") as f:
+                    shutil.copyfileobj(f, out)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return sum(written)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write every structure of one length (exhaustive enumeration over a process pool).")
+    parser.add_argument("L", type=int, help="Structure length")
+    parser.add_argument("--h", type=int, default=3, help="Minimum helix length (default: 3)")
+    parser.add_argument("--theta", type=int, default=3, help="Minimum loop length (default: 3)")
+    parser.add_argument("--out", default=None, help="Output file (default: output/enumerated/all_L{L}_h{h}_theta{theta}.txt)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per core)")
+    parser.add_argument("--parts", type=int, default=None, help="Number of index ranges (default: 4 per worker)")
+    args = parser.parse_args()
+
+    out_file = args.out or f"output/enumerated/all_L{args.L}_h{args.h}_theta{args.theta}.txt"
+    os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+    total = enumerate_dataset(args.L, args.h, args.theta, out_file, args.workers, args.parts)
+    print(f"  -> Saved {total} to {out_file}")
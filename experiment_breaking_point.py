@@ -1,9 +1,13 @@
 import time
 import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from generate_structures import countS, generateS
+from generate_structures import sample_batch
+from table_store import TableCache, TableStore
 from benchmark_tools import run_rnainverse, run_rnafold
 
+# Tables are shared in memory across the configs of a run and kept on disk across runs
+TABLE_CACHE = TableCache(TableStore())
+
 def evaluate_structure(s):
     # Run up to 10 independent trials to distinguish 'undesignable' from 'stochastic miss'
     for _ in range(10):
@@ -14,22 +18,12 @@ def evaluate_structure(s):
                 return 1
     return 0
 
-def test_config(L, h, theta, n_structs=100):
-    cache = {}
-    Wu = 1.0
-    Ws = 1.0
-    
-    total_weight = countS(L, cache, Wu, Ws, h, theta)
-    if total_weight == 0:
-        return 0, 0
+def test_config(L, h, theta, n_structs=100, seed=None):
+    params = {"wu": 1.0, "ws": 1.0, "h": h, "theta": theta}
 
-    structures = []
-    attempts = 0
-    while len(structures) < n_structs and attempts < n_structs * 3:
-        attempts += 1
-        s = generateS(L, cache, Wu, Ws, h, theta)
-        if s and '(' in s:
-            structures.append(s)
+    # Draw the whole candidate pool at once; keep the first n_structs that contain a helix
+    candidates = sample_batch(params, L, n_structs * 3, seed=seed, store=TABLE_CACHE)
+    structures = [s for s in candidates if '(' in s][:n_structs]
 
     if not structures:
         return 0, 0
@@ -64,7 +58,7 @@ def main():
     
     for L in lengths:
         for h in h_values:
-            success, tried = test_config(L, h, theta, n_structs)
+            success, tried = test_config(L, h, theta, n_structs, seed=L * 100 + h)
             
             if tried == 0:
                 rate_str = "Impossible"
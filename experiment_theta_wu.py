@@ -1,9 +1,14 @@
 import time
 import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from generate_structures import countS, generateS
+from generate_structures import ParametricTables, build_tables, countS, generateS
+from table_backends import DEFAULT_BACKEND
+from table_store import TableCache, TableStore
 from benchmark_tools import run_rnainverse, run_rnafold
 
+# Tables are shared in memory across the configs of a run and kept on disk across runs
+TABLE_CACHE = TableCache(TableStore())
+
 def evaluate_structure(s):
     seq, ok = run_rnainverse(s, timeout_sec=5)
     if ok and seq:
@@ -13,7 +18,8 @@ def evaluate_structure(s):
     return 0
 
 def test_config(L, h, theta, wu, ws, n_structs=100):
-    cache = {}
+    # Tables for each (h, theta, wu, ws) point come from the on-disk store when an earlier run built them
+    cache = {"tables": build_tables(L, wu, ws, h, theta, backend=DEFAULT_BACKEND, store=TABLE_CACHE)}
     total_weight = countS(L, cache, wu, ws, h, theta)
     if total_weight == 0:
         return 0, 0
@@ -71,11 +77,13 @@ def experiment_B():
     ws = 1.0
     
     print(f"\n--- Experiment B: Impact of Unpaired Weight (L={L}, theta={theta}, Ws={ws}) ---")
-    print(f"{'h':<4} | {'Wu':<5} | {'Success Rate':<15}")
-    print("-" * 35)
+    print(f"{'h':<4} | {'Wu':<5} | {'Unpaired':<8} | {'Success Rate':<15}")
+    print("-" * 46)
     
     for h in h_values:
-        for wu in wu_values:
+        # One polynomial build per h gives the exact expected unpaired fraction of every Wu
+        unpaired = ParametricTables(h, theta, L).unpaired_fraction(L, wu_values, ws)
+        for wu, frac in zip(wu_values, unpaired):
             success, tried = test_config(L, h, theta, wu, ws, n_structs)
             if tried == 0:
                 rate_str = "Impossible"
@@ -83,7 +91,7 @@ def experiment_B():
                 rate = (success / tried) * 100
                 rate_str = f"{success}/{tried} ({rate:.1f}%)"
             
-            print(f"{h:<4} | {wu:<5.1f} | {rate_str:<15}")
+            print(f"{h:<4} | {wu:<5.1f} | {frac:<8.3f} | {rate_str:<15}")
             sys.stdout.flush()
 
 def main():
@@ -5,6 +5,7 @@ import random
 # Add current directory to path to import generate_with_motif
 sys.path.append('.')
 from generate_with_motif import generateS, countS
+from generate_structures import unique_structures
 
 def generate_set(l, h, theta, wu, count):
     ws = 1.0  # weight of stack
@@ -14,14 +15,9 @@ def generate_set(l, h, theta, wu, count):
     total_weight = countS(l, cache, wu, ws, wm, h, theta)
     print(f"  Total weight for h={h}, theta={theta}: {total_weight:.2e}")
     
-    structures = []
-    attempts = 0
-    while len(structures) < count and attempts < count * 100:
-        struct = generateS(l, cache, wu, ws, wm, h, theta)
-        if struct and struct not in structures:
-            structures.append(struct)
-        attempts += 1
-    return structures
+    # Hash-based dedup instead of scanning the list for every draw
+    draws = (generateS(l, cache, wu, ws, wm, h, theta) for _ in range(count * 100))
+    return list(unique_structures(draws, limit=count))
 
 if __name__ == "__main__":
     l = 50
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_structures import sample_batch
+from table_store import TableCache, TableStore
+
+# One TableCache per cache directory and process: configs sharing a grammar reuse its tables
+_TABLE_CACHES = {}
+
+def config_length(cfg):
+    """Structure length of a config ("L" or "length" key)."""
+    return cfg["L"] if "L" in cfg else cfg["length"]
+
+def plan_shards(configs, n, shard_size):
+    """
+    Splits every config into shards of at most shard_size structures.
+    Inputs:
+        configs: list of dict - Dataset configs (name, length and grammar weights)
+        n: int - Structures per config (a config may override it with an "n" key)
+        shard_size: int - Maximum structures per shard
+    Outputs:
+        list of (cfg, shard index, count) tuples, in output order
+    """
+    shards = []
+    for cfg in configs:
+        total = cfg.get("n", n)
+        for shard, start in enumerate(range(0, total, shard_size)):
+            shards.append((cfg, shard, min(shard_size, total - start)))
+    return shards
+
+def shard_seed(seed, cfg, shard):
+    """Seed of one shard; depends only on the base seed, config name and shard index."""
+    return f"{seed}:{cfg['name']}:{shard}"
+
+def shard_path(shard_dir, name, shard):
+    return os.path.join(shard_dir, name, f"{shard:05d}.txt")
+
+def table_cache(cache_dir=None):
+    """In-process TableCache of this process for a TableStore directory (None: memory only)."""
+    if cache_dir not in _TABLE_CACHES:
+        _TABLE_CACHES[cache_dir] = TableCache(TableStore(cache_dir) if cache_dir else None)
+    return _TABLE_CACHES[cache_dir]
+
+def write_shard(cfg, shard, count, seed, shard_dir, cache_dir=None):
+    """
+    Samples one shard of a config with its own tables and RNG and writes it to disk.
+    Outputs:
+        int - Number of structures written (0 if the grammar has no structure of length L)
+    """
+    L = config_length(cfg)
+    packed = sample_batch(cfg, L, count, seed=shard_seed(seed, cfg, shard), packed=True, store=table_cache(cache_dir))
+    path = shard_path(shard_dir, cfg["name"], shard)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        for start in range(0, len(packed), L):
+            f.write(packed[start:start + L])
+            f.write(b"\n")
+    os.replace(path + ".tmp", path)
+    return len(packed) // L if L else 0
+
+def _write_shard(task):
+    return write_shard(*task)
+
+def generate_datasets(configs, n, out_dir, workers=None, seed=0, shard_size=1000,
+                      cache_dir="output/table_cache", keep_shards=False):
+    """
+    Generates one dataset file per config, sharded over a process pool.
+    Every shard is sampled with its own seed and the shards are concatenated in
+    order, so the files are byte-identical whatever the number of workers.
+    The shards are written to a shards-* directory of this run under out_dir, so
+    runs into the same directory do not share them.
+    Inputs:
+        configs: list of dict - Dataset configs (same shape as generate_final_datasets.configs)
+        n: int - Structures per config
+        out_dir: str - Output directory, config `name` is written to out_dir/name.txt
+        workers: int or None - Number of processes (None: one per core, 1: no pool)
+        seed: int - Base seed
+        shard_size: int - Maximum structures per shard
+        cache_dir: str or None - TableStore directory shared by the workers
+        keep_shards: bool - Keep the run's shard directory after merging
+    Outputs:
+        dict - Number of structures written per config name
+    """
+    shards = plan_shards(configs, n, shard_size)
+    shard_dir = tempfile.mkdtemp(prefix="shards-", dir=out_dir)
+    try:
+        tasks = [(cfg, shard, count, seed, shard_dir, cache_dir) for cfg, shard, count in shards]
+        if workers == 1:
+            written = list(map(_write_shard, tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                written = list(pool.map(_write_shard, tasks))
+
+        totals, n_shards = {}, {}
+        for (cfg, shard, _), count in zip(shards, written):
+            totals[cfg["name"]] = totals.get(cfg["name"], 0) + count
+            n_shards[cfg["name"]] = shard + 1
+        for cfg in configs:
+            name = cfg["name"]
+            if totals.get(name, 0) == 0:
+                print(f"  Warning: Total weight is 0. Cannot generate structures for {name}.")
+                continue
+            out_file = os.path.join(out_dir, f"{name}.txt")
+            with open(out_file, "wb") as out:
+                for shard in range(n_shards.get(name, 0)):
+                    with open(shard_path(shard_dir, name, shard), "rb") as f:
+                        shutil.copyfileobj(f, out)
+            print(f"  -> Saved {totals.get(name, 0)} to {out_file}")
+    finally:
+        if keep_shards:
+            print(f"  Shards kept in {shard_dir}")
+        else:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate structure datasets from a JSON list of configs over a process pool.")
+    parser.add_argument("configs", help="JSON file with a list of configs (name, L or length, grammar weights, h, theta, optional mask)")
+    parser.add_argument("--n", type=int, default=100, help="Structures per config (default: 100)")
+    parser.add_argument("--out", default="output/final_datasets", help="Output directory (default: output/final_datasets)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed (default: 0)")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Structures per shard (default: 1000)")
+    parser.add_argument("--table-cache", default="output/table_cache", help="Table store directory, empty to disable")
+    parser.add_argument("--keep-shards", action="store_true", help="Keep the run's shard directory")
+    args = parser.parse_args()
+
+    with open(args.configs) as f:
+        configs = json.load(f)
+    os.makedirs(args.out, exist_ok=True)
+    generate_datasets(configs, args.n, args.out, args.workers, args.seed, args.shard_size,
+                      args.table_cache or None, args.keep_shards)
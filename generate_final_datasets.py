@@ -1,9 +1,9 @@
 import sys
 import os
 
-# Append current dir to path to import from generate_structures
+# Append current dir to path to import from generate_datasets
 sys.path.append('.')
-from generate_structures import countS, generateS
+from generate_datasets import generate_datasets
 
 configs = [
     {"L": 50, "h": 2, "theta": 3, "Wu": 1.0, "Ws": 1.0, "name": "l50_h2_t3_wu1"},
@@ -16,33 +16,12 @@ configs = [
 ]
 
 N = 100
+SEED = 0  # Every shard gets its own seed derived from SEED, so reruns are reproducible
 out_dir = "output/final_datasets"
-os.makedirs(out_dir, exist_ok=True)
 
-for cfg in configs:
-    L, h, theta, Wu, Ws, name = cfg["L"], cfg["h"], cfg["theta"], cfg["Wu"], cfg["Ws"], cfg["name"]
-    cache = {}
-    print(f"Generating {N} structures for {name}...")
-    
-    # Pre-calculate probabilities for generation
-    total_weight = countS(L, cache, Wu, Ws, h, theta)
-    if total_weight == 0:
-        print(f"  Warning: Total weight is 0. Cannot generate structures for this configuration.")
-        continue
-        
-    structures = []
-    failed = 0
-    for i in range(N):
-        s = generateS(L, cache, Wu, Ws, h, theta)
-        if s:
-            structures.append(s)
-        else:
-            failed += 1
-            
-    out_file = f"{out_dir}/{name}.txt"
-    with open(out_file, "w") as f:
-        for s in structures:
-            f.write(s + "\n")
-    print(f"  -> Saved {len(structures)} to {out_file} (Failed: {failed})")
-
-print("\nAll datasets generated successfully!")
+if __name__ == "__main__":
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"Generating {N} structures for {len(configs)} configs...")
+    # Configs are split into shards sampled in parallel; the output does not depend on the worker count
+    generate_datasets(configs, N, out_dir, seed=SEED)
+    print("\nAll datasets generated successfully!")
@@ -1,47 +1,106 @@
+import hashlib
+import math
 import random
 import sys
+from itertools import islice
+from operator import mul
 
-# Increase recursion depth for deep structures
-sys.setrecursionlimit(20000)
+import grammar_engine
+from grammar_engine import GrammarSpec, Rule, decompose_helices, row_property, write_structure
+from table_backends import check_backend, np
+
+def grammar_spec(wu, ws, h, theta):
+    """
+    The S/T grammar as engine rules.
+    Inputs:
+        wu: float - Weight for unpaired bases
+        ws: float - Weight of a helix
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+    Outputs:
+        GrammarSpec
+    S -> . S | (*h T )*h S | eps
+    T -> . S | (*h T )*h . S | (*h T )*h (*h T )*h S     (T has length >= theta)
+    Rules are marked with the number of helices they open, so the marks of a structure count its helices.
+    """
+    opening, closing = "(" * h, ")" * h
+    return GrammarSpec([
+        Rule("S", (".", "S"), wu),
+        Rule("S", (opening, "T", closing, "S"), ws, mark=1),
+        Rule("S", ()),
+        Rule("T", (".", "S"), wu),
+        Rule("T", (opening, "T", closing, ".", "S"), ws * wu, mark=1),
+        Rule("T", (opening, "T", closing, opening, "T", closing, "S"), ws * ws, mark=2),
+    ], min_len={"T": theta})
+
+class GrammarTables(grammar_engine.GrammarTables):
+    """
+    Engine tables of the S/T grammar.
+    Attributes (besides those of grammar_engine.GrammarTables):
+        wu, ws, h, theta: grammar parameters the tables were built for
+        S: row - S[n] is the total weight of structures of length n starting with S
+        T: row - T[n] is the total weight of internal structures of length n (Grammar T)
+        U: row - U[n] is the total weight of T followed by S over length n
+               (U -> T S, no helix weight), so a helix followed by S over n is ws * U[n-2h]
+    """
+    S = row_property("S")
+    T = row_property("T")
+    U = row_property(("T", "S"))
+
+    def __init__(self, wu, ws, h, theta, scaled=True, backend="python"):
+        self.wu, self.ws, self.h, self.theta = wu, ws, h, theta
+        super().__init__(grammar_spec(wu, ws, h, theta), scaled, backend)
+
+def build_tables(L, wu, ws, h, theta, scaled=True, backend="python", store=None):
+    """
+    Builds the S/T weight tables for all lengths 0..L in one forward pass.
+    Inputs:
+        L: int - Maximum length
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs (stacks)
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        scaled: bool - Keep rows in scaled-per-length units (no overflow for long L / large weights)
+        backend: str - "python" or "numpy" (vectorized slice products, needs numpy)
+        store: TableStore, TableCache or None - Table cache to load the tables from / save them to
+    Outputs:
+        GrammarTables - Reusable table object
+    """
+    tables = GrammarTables(wu, ws, h, theta, scaled, backend)
+    if store is not None:
+        return store.get(tables, L)
+    return tables.extend(L)
+
+def _tables_for(n, cache, wu, ws, h, theta):
+    """
+    Returns the GrammarTables stored in `cache`, built/extended to cover length n.
+    """
+    tables = cache.get("tables")
+    if tables is None:
+        tables = cache["tables"] = GrammarTables(wu, ws, h, theta)
+    if tables.L < n:
+        tables.extend(n)
+    return tables
 
 def countS(n, cache, wu, ws, h, theta):
     """
     Counts total weight of structures of length n starting with S.
     Inputs:
         n: int - Length of the sequence
-        cache: dict - Memoization dict to store previous calculations
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
         wu: float - Weight for unpaired bases
         ws: float - Weight for base pairs (stacks)
         h: int - Minimum helix length
         theta: int - Minimum loop length
     Outputs:
-        float - Total weight of structures
+        float - Total weight of structures (inf past float range, see GrammarTables.log_weight)
     S -> . S(n-1)
     S -> (*h T(k) )*h S(n-2h-k)
     S -> eps
     """
     if n == 0: return 1.0
-    if ("S", n) in cache: return cache[("S", n)]
-    
-    val = 0.0
-    
-    # 1. Unpaired: . S
-    if n >= 1:
-        val += wu * countS(n-1, cache, wu, ws, h, theta)
-    
-    # 2. Paired: (*h T )*h S
-    # Requires 2*h + k + m = n
-    # Helix uses 2*h. T uses k. S uses m.
-    # T requires min length theta. So k >= theta.
-    # m >= 0.
-    # max k = n - 2*h.
-    if n >= 2*h + theta:
-        for k in range(theta, n - 2*h + 1):
-            term = ws * countT(k, cache, wu, ws, h, theta) * countS(n - 2*h - k, cache, wu, ws, h, theta)
-            val += term
-            
-    cache[("S", n)] = val
-    return val
+    tables = _tables_for(n, cache, wu, ws, h, theta)
+    return tables.weight(tables.S, n)
 
 def countT(n, cache, wu, ws, h, theta):
     """
@@ -49,7 +108,7 @@ def countT(n, cache, wu, ws, h, theta):
     Constraint: n >= theta (min pair distance).
     Inputs:
         n: int - Length of the sequence inside the helix
-        cache: dict - Memoization dict
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
         wu: float - Weight for unpaired bases
         ws: float - Weight for base pairs
         h: int - Minimum helix length
@@ -62,54 +121,593 @@ def countT(n, cache, wu, ws, h, theta):
     T -> (*h T )*h (*h T )*h S
     """
     if n < theta: return 0.0
-    if ("T", n) in cache: return cache[("T", n)]
-    
-    val = 0.0
-    
-    # 1. T -> . S
-    # Requires 1 + m = n => m = n - 1
-    # n >= theta is guaranteed by start check.
-    # S(n-1) valid if n-1 >= 0. Since n>=theta>=0, n-1 could be -1 if theta=0? 
-    # Usually theta >= 1. If theta=3, n>=3, n-1>=2.
-    if n >= 1:
-        val += wu * countS(n-1, cache, wu, ws, h, theta)
-        
-    # 2. T -> (*h T )*h . S
-    # Structure: Helix(size 2h+k) . S(size m)
-    # Total n = (2h + k) + 1 + m = 2h + k + 1 + m
-    # k >= theta. m >= 0.
-    # Min length required: 2h + theta + 1.
-    if n >= 2*h + theta + 1:
-        # Loop over possible k (size of inner T)
-        # max k: n - 2h - 1 (since m=0).
-        for k in range(theta, n - 2*h - 1 + 1):
-            rem_after_helix_dot = n - (2*h + k + 1)
-            term = ws * countT(k, cache, wu, ws, h, theta) * wu * countS(rem_after_helix_dot, cache, wu, ws, h, theta)
-            val += term
-
-    # 3. T -> (*h T )*h (*h T )*h S
-    # Structure: H1(size 2h+k1) H2(size 2h+k2) S(size m)
-    # Total n = (2h+k1) + (2h+k2) + m = 4h + k1 + k2 + m
-    # k1, k2 >= theta. m >= 0.
-    # Min length: 4h + 2*theta.
-    if n >= 4*h + 2*theta:
-        # We can optimize this sum if needed, but for length ~100-200, nested loops are acceptable.
-        # Loop k1
-        # max k1: n - (2h + theta) - (rem_min=0) - 2h = n - 4h - theta.
-        for k1 in range(theta, n - 4*h - theta + 1):
-            min_k2 = theta
-            max_k2 = n - 4*h - k1 # since m >= 0
-            
-            # Precompute term1
-            term1 = ws * countT(k1, cache, wu, ws, h, theta)
-            
-            for k2 in range(min_k2, max_k2 + 1):
-                rem_after_H1_H2 = n - 4*h - k1 - k2
-                term = term1 * ws * countT(k2, cache, wu, ws, h, theta) * countS(rem_after_H1_H2, cache, wu, ws, h, theta)
-                val += term
-
-    cache[("T", n)] = val
-    return val
+    tables = _tables_for(n, cache, wu, ws, h, theta)
+    return tables.weight(tables.T, n)
+
+def countU(n, cache, wu, ws, h, theta):
+    """
+    Counts total weight of T followed by S over length n (no helix weight).
+    A helix followed by S over length n therefore weighs ws * countU(n - 2h).
+    Inputs:
+        n: int - Length of the sequence
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+    Outputs:
+        float - Total weight
+    U -> T(k) S(n-k)
+    """
+    if n < theta: return 0.0
+    tables = _tables_for(n, cache, wu, ws, h, theta)
+    return tables.weight(tables.U, n)
+
+def expected_statistics(n, wu, ws, h, theta, backend="python"):
+    """
+    Exact mean and variance of the number of helices and of the unpaired
+    fraction of the structures of length n (n >= 1), without sampling.
+    Outputs:
+        dict - "helices" and "unpaired_fraction" -> (mean, variance)
+    """
+    stats = grammar_engine.feature_statistics(grammar_spec(wu, ws, h, theta), n, {
+        "helices": grammar_engine.mark_count, "unpaired": grammar_engine.unpaired_count}, backend=backend)
+    mean, var = stats.pop("unpaired")
+    stats["unpaired_fraction"] = (mean / n, var / n**2)
+    return stats
+
+def sampleU(n, cache, wu, ws, h, theta):
+    """
+    Draws the split point of U -> T(k) S(n-k) proportionally to T(k) * S(n-k).
+    Inputs:
+        n: int - Length covered by U
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
+        wu, ws, h, theta: Grammar parameters
+    Outputs:
+        int or None - Length k of the T part (the S part has length n-k)
+    """
+    return _tables_for(n, cache, wu, ws, h, theta).draw(("T", "S"), n)
+
+def sample_structure(tables, n, symbol="S", rng=random):
+    """
+    Draws one structure of length n derived from `symbol` without recursion.
+    Inputs:
+        tables: GrammarTables - Tables covering length n
+        n: int - Length of the structure
+        symbol: str - "S" for a full structure, "T" for the inside of a helix
+        rng: random.Random or module - Source of random draws (global `random` by default)
+    Outputs:
+        str - Dot-bracket structure
+    """
+    return grammar_engine.sample_structure(tables, n, symbol, rng)
+
+class ParametricTables:
+    """
+    S tables as polynomials in wu and ws, built once per (h, theta) and evaluated at any weights.
+    A structure of length n with k helices has n - 2hk unpaired bases, so its weight is
+    wu**(n-2hk) * ws**k and S(n) = sum_k count[k, n] * wu**(n-2hk) * ws**k: the helix
+    count alone indexes the coefficients. They are built and kept as logs
+    (grammar_engine.LogCountTables), so every count keeps full precision at any length
+    and evaluating a whole (wu, ws) grid is one vectorized pass with no overflow. Needs numpy.
+    Attributes:
+        h, theta: int - Grammar parameters
+        L: int - Largest length covered
+        log_counts: numpy.ndarray - log_counts[k, n] is the log number of S structures
+            of length n with k helices (-inf if there is none)
+    """
+    def __init__(self, h, theta, L):
+        check_backend("numpy")
+        self.h, self.theta, self.L = h, theta, L
+        # No structure of length <= L has more than L // 2h helices, so the saturating count stays empty
+        K = L // (2 * h) + 1
+        tables = grammar_engine.LogCountTables(grammar_spec(1, 1, h, theta), K).extend(L)
+        self.log_counts = tables.rows["S"][:K]
+        self.helices = np.arange(K)
+
+    def log_terms(self, n, wu, ws):
+        """
+        Log weight of the structures of length n with k helices, for every k.
+        Inputs:
+            n: int - Structure length (<= L)
+            wu, ws: float or numpy.ndarray - Positive weights (broadcast together)
+        Outputs:
+            numpy.ndarray - Shape (K,) + broadcast shape of wu and ws
+        """
+        log_wu, log_ws = np.log(np.asarray(wu, dtype=float)), np.log(np.asarray(ws, dtype=float))
+        shape = (-1,) + (1,) * np.broadcast(log_wu, log_ws).ndim
+        k = self.helices.reshape(shape)
+        return self.log_counts[:, n].reshape(shape) + (n - 2 * self.h * k) * log_wu + k * log_ws
+
+    def log_weight(self, n, wu, ws):
+        """Natural log of S(n) at (wu, ws), vectorized over wu / ws (-inf if there is no structure)."""
+        terms = self.log_terms(n, wu, ws)
+        top = terms.max(axis=0)
+        safe = np.where(np.isfinite(top), top, 0.0)
+        with np.errstate(divide="ignore"):
+            return safe + np.log(np.exp(terms - safe).sum(axis=0))
+
+    def helix_distribution(self, n, wu, ws):
+        """
+        Probability of every helix count among the structures of length n at (wu, ws).
+        Outputs:
+            numpy.ndarray - p[k, ...] (all zero if there is no structure)
+        """
+        terms = self.log_terms(n, wu, ws)
+        top = terms.max(axis=0)
+        p = np.exp(terms - np.where(np.isfinite(top), top, 0.0))
+        total = p.sum(axis=0)
+        return p / np.where(total > 0, total, 1.0)
+
+    def expected_helices(self, n, wu, ws):
+        """Expected number of helices of a structure of length n at (wu, ws)."""
+        p = self.helix_distribution(n, wu, ws)
+        return (p * self.helices.reshape((-1,) + (1,) * (p.ndim - 1))).sum(axis=0)
+
+    def unpaired_fraction(self, n, wu, ws):
+        """Expected fraction of unpaired bases of a structure of length n at (wu, ws)."""
+        return (n - 2 * self.h * self.expected_helices(n, wu, ws)) / n
+
+    def tune_wu(self, n, target, ws=1.0, lo=1e-3, hi=1e3, iterations=60):
+        """
+        Finds the wu giving an expected unpaired fraction of `target` at length n.
+        The fraction grows with wu, so a bisection on log(wu) converges; targets
+        outside what [lo, hi] can reach return the nearest bound.
+        Inputs:
+            n: int - Structure length
+            target: float or numpy.ndarray - Target unpaired fraction(s)
+            ws: float - Helix weight
+            lo, hi: float - Search range for wu
+            iterations: int - Bisection steps
+        Outputs:
+            float or numpy.ndarray - wu for every target
+        """
+        target = np.asarray(target, dtype=float)
+        a = np.full(target.shape, np.log(lo))
+        b = np.full(target.shape, np.log(hi))
+        for _ in range(iterations):
+            mid = (a + b) / 2
+            low = self.unpaired_fraction(n, np.exp(mid), ws) < target
+            a, b = np.where(low, mid, a), np.where(low, b, mid)
+        wu = np.exp((a + b) / 2)
+        return float(wu) if wu.ndim == 0 else wu
+
+def _exact_tables_for(n, cache, h, theta):
+    """
+    Returns the ExactTables of the uniform grammar (wu = ws = 1) stored in `cache`, extended to cover length n.
+    """
+    tables = cache.get("exact")
+    if tables is None:
+        tables = cache["exact"] = grammar_engine.ExactTables(grammar_spec(1, 1, h, theta))
+    if tables.L < n:
+        tables.extend(n)
+    return tables
+
+def count_structures(n, cache, h, theta):
+    """
+    Exact number of structures of length n (countS for wu = ws = 1, as a Python int).
+    Inputs:
+        n: int - Length of the structures
+        cache: dict - Holds the exact tables shared between calls (key "exact")
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+    Outputs:
+        int - Number of structures
+    """
+    return _exact_tables_for(n, cache, h, theta).count(n)
+
+def unrank(index, n, cache, h, theta):
+    """
+    The structure of length n with a given index, 0 <= index < count_structures(n, ...).
+    Indices follow the rule order of the grammar, so index ranges can be
+    enumerated, sharded or sampled without replacement on different machines.
+    Inputs:
+        index: int - Index of the structure
+        n: int - Length of the structure
+        cache: dict - Holds the exact tables shared between calls (key "exact")
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+    Outputs:
+        str - Dot-bracket structure
+    """
+    return grammar_engine.unrank(_exact_tables_for(n, cache, h, theta), index, n)
+
+def rank(structure, cache, h, theta):
+    """
+    Index of a structure among all structures of its length (inverse of unrank).
+    Inputs:
+        structure: str - Dot-bracket structure
+        cache: dict - Holds the exact tables shared between calls (key "exact")
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+    Outputs:
+        int - Index of the structure
+    Raises ValueError if the grammar cannot produce the structure.
+    """
+    tables = _exact_tables_for(len(structure), cache, h, theta)
+    S_dot, S_helix, S_eps, T_dot, T_helix, T_two = tables.spec.rules
+    match, stack = [None] * len(structure), []
+    for i, c in enumerate(structure):
+        if c == "(":
+            stack.append(i)
+        elif c == ")":
+            if not stack:
+                raise ValueError(f"Unbalanced structure {structure!r}")
+            match[i] = stack.pop()
+            match[match[i]] = i
+    if stack:
+        raise ValueError(f"Unbalanced structure {structure!r}")
+
+    def helix_end(pos, end):
+        # Position after the helix of h pairs opened at pos around a loop of at least theta,
+        # None if there is no such helix inside [pos, end)
+        j = match[pos]
+        if structure[pos] != "(" or j >= end or j + 1 - pos - 2 * h < theta:
+            return None
+        if any(structure[pos + i] != "(" or match[pos + i] != j - i for i in range(h)):
+            return None
+        return j + 1
+
+    def parse(s, symbol, pos, n):
+        if n == 0:
+            return (S_eps, []) if symbol == "S" else None
+        if s[pos] == ".":
+            return (S_dot if symbol == "S" else T_dot), [n - 1]
+        end = helix_end(pos, pos + n)
+        if end is None:
+            return None
+        inner, rest = end - pos - 2 * h, pos + n - end
+        if symbol == "S":
+            return S_helix, [inner, rest]
+        if rest and s[end] == ".":
+            return T_helix, [inner, rest - 1]
+        end2 = helix_end(end, pos + n) if rest else None
+        if end2 is None:
+            return None
+        return T_two, [inner, end2 - end - 2 * h, pos + n - end2]
+
+    return grammar_engine.rank(tables, structure, parse)
+
+def iter_all_structures(n, cache, h, theta, start=0, stop=None):
+    """
+    Lazily yields every structure of length n exactly once, in unrank order.
+    Memory stays O(n) however many structures there are.
+    Inputs:
+        n: int - Length of the structures
+        cache: dict - Holds the exact tables shared between calls (key "exact")
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        start, stop: int - Only yield the structures with index in [start, stop)
+    Outputs:
+        iterator of str - Structures unrank(start), unrank(start + 1), ...
+    """
+    tables = _exact_tables_for(n, cache, h, theta)
+    structures = grammar_engine.enumerate_structures(tables, n, start=start)
+    return structures if stop is None else islice(structures, max(stop - start, 0))
+
+def enumeration_ranges(n, cache, h, theta, parts):
+    """
+    Splits the index space of the structures of length n into `parts` contiguous ranges of
+    near-equal size, one per worker (see iter_all_structures).
+    Outputs:
+        list of (int, int) - (start, stop) ranges covering [0, count_structures(n, ...))
+    """
+    total = count_structures(n, cache, h, theta)
+    bounds = [total * i // parts for i in range(parts + 1)]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+def sample_distinct(k, n, h, theta, seed=None, cache=None):
+    """
+    Draws k distinct structures of length n uniformly without replacement, by drawing
+    distinct indices and unranking them (no generate-then-dedup loop).
+    Inputs:
+        k: int - Number of structures (all of them if there are fewer)
+        n: int - Length of the structures
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        seed: int, str or None - Seed of the dedicated random.Random
+        cache: dict or None - Holds the exact tables shared between calls
+    Outputs:
+        list of str - Distinct structures
+    """
+    cache = {} if cache is None else cache
+    total = count_structures(n, cache, h, theta)
+    rng = random.Random(seed)
+    if total <= sys.maxsize:
+        indices = rng.sample(range(total), min(k, total))
+    else:
+        # k is far below total here, so rejections are rare
+        seen = set()
+        indices = []
+        while len(indices) < k:
+            i = rng.randrange(total)
+            if i not in seen:
+                seen.add(i)
+                indices.append(i)
+    return [unrank(i, n, cache, h, theta) for i in indices]
+
+def parse_mask(mask):
+    """
+    Checks a constraint mask and matches its brackets.
+    Inputs:
+        mask: str - Partial dot-bracket: '.' unpaired, '(' / ')' paired together, 'x' free
+    Outputs:
+        list - partner[i] of every bracket position (None elsewhere)
+    Raises ValueError on unknown characters or unbalanced brackets.
+    """
+    partner, stack = [None] * len(mask), []
+    for i, c in enumerate(mask):
+        if c == "(":
+            stack.append(i)
+        elif c == ")":
+            if not stack:
+                raise ValueError(f"Unbalanced ')' at position {i} of the mask")
+            j = stack.pop()
+            partner[i], partner[j] = j, i
+        elif c not in ".x":
+            raise ValueError(f"Unknown mask character {c!r} at position {i} (expected '.', '(', ')' or 'x')")
+    if stack:
+        raise ValueError(f"Unbalanced '(' at position {stack[-1]} of the mask")
+    return partner
+
+def mask_consistent(structure, mask):
+    """
+    Whether a structure satisfies a mask: its unpaired positions are unpaired and
+    its pairs are pairs of the structure ('x' positions are free).
+    """
+    if len(structure) != len(mask):
+        return False
+    partner, target = parse_mask(mask), parse_mask(structure)
+    return all(c == "x" or (c == structure[i] and partner[i] == target[i]) for i, c in enumerate(mask))
+
+class ConstrainedTables:
+    """
+    S/T tables restricted to the structures of one length that satisfy a mask.
+    A mask fixes positions and pairs, so weights depend on where a subtree sits and not
+    only on its length: the tables are indexed by interval [i, j) of the mask. Every
+    helix checks its h pairs against the mask when it is placed, so only consistent
+    structures are counted and sampling needs no rejection. The build is O(n^3).
+    Weights are in table units: every emitted character is divided by `scale` (the
+    per-base weight of the unconstrained grammar at length n), so rows stay in float range.
+    Attributes:
+        mask: str - Constraint mask (see parse_mask)
+        wu, ws, h, theta: grammar parameters the tables were built for
+        n: int - Length of the mask
+        unpaired: list of bool - Whether each position may be unpaired
+        scale: float - Weight unit per emitted character
+        S, T: list of list - S[i][j] / T[i][j] weights of mask[i:j] derived from S / T
+        H: list of list - H[i][m] weight of a helix over mask[i:m] (helix weight times T inside)
+        HS: list of list - HS[i][j] weight of a helix over mask[i:m] followed by a nonempty S over mask[m:j]
+    """
+    def __init__(self, mask, wu, ws, h, theta):
+        self.mask, self.wu, self.ws, self.h, self.theta = mask, wu, ws, h, theta
+        self.n = n = len(mask)
+        partner = parse_mask(mask)
+        log_weight = GrammarTables(wu, ws, h, theta).extend(n).log_weight(n) if n else 0.0
+        self.scale = c = math.exp(log_weight / n) if n and math.isfinite(log_weight) else 1.0
+        w_dot, w_helix = wu / c, ws / c**(2 * h)
+
+        self.unpaired = unpaired = [ch in ".x" for ch in mask]
+        def pair_ok(a, b):
+            return (mask[a] == "x" or (mask[a] == "(" and partner[a] == b)) and \
+                   (mask[b] == "x" or (mask[b] == ")" and partner[b] == a))
+
+        S = [[0.0] * (n + 1) for _ in range(n + 1)]
+        T = [[0.0] * (n + 1) for _ in range(n + 1)]
+        H = [[0.0] * (n + 1) for _ in range(n + 1)]
+        HS = [[0.0] * (n + 1) for _ in range(n + 1)]
+        # S_col[j][m] = S[m][j], so that helix-then-S sums run over contiguous lists
+        S_col = [[0.0] * (n + 1) for _ in range(n + 1)]
+        shortest = 2 * h + theta
+        for i in range(n, -1, -1):
+            S[i][i] = S_col[i][i] = 1.0
+            for m in range(i + shortest, n + 1):
+                inside = T[i + h][m - h]
+                if inside > 0 and all(pair_ok(i + t, m - 1 - t) for t in range(h)):
+                    H[i][m] = w_helix * inside
+            row_H = H[i]
+            for j in range(i + 1, n + 1):
+                dot = w_dot * S[i + 1][j] if unpaired[i] else 0.0
+                # Helix over [i, m) then a nonempty S over [m, j)
+                hs = sum(map(mul, row_H[i + shortest:j], S_col[j][i + shortest:j])) if j - i > shortest else 0.0
+                HS[i][j] = hs
+                S[i][j] = S_col[j][i] = dot + hs + row_H[j]
+                if j - i >= theta:
+                    # T -> . S | helix . S | helix helix S, i.e. a dot, or a helix followed by a nonempty S
+                    T[i][j] = dot + hs
+        self.S, self.T, self.H, self.HS = S, T, H, HS
+
+    def log_weight(self):
+        """Natural log of the total weight of the consistent structures (-inf if there is none)."""
+        x = self.S[0][self.n]
+        return math.log(x) + self.n * math.log(self.scale) if x > 0 else -math.inf
+
+    def weight(self):
+        """Total weight of the consistent structures (countS restricted to the mask; inf past float range)."""
+        log_weight = self.log_weight()
+        try:
+            return math.exp(log_weight)
+        except OverflowError:
+            return math.inf
+
+    def _draw_helix(self, i, j, rng):
+        """Draws the end m of the helix opening at i in a helix-then-nonempty-S over [i, j)."""
+        row_H, S = self.H[i], self.S
+        u = rng.random() * self.HS[i][j]
+        last = None
+        for m in range(i + 2 * self.h + self.theta, j):
+            w = row_H[m] * S[m][j]
+            if w > 0:
+                if u < w:
+                    return m
+                u -= w
+                last = m
+        # Only reached through float rounding
+        return last
+
+    def sample(self, rng=random):
+        """
+        Draws one consistent structure with probability proportional to its weight.
+        Inputs:
+            rng: random.Random or module - Source of random draws
+        Outputs:
+            str or None - Dot-bracket structure (None if no structure satisfies the mask)
+        """
+        n, h = self.n, self.h
+        if self.S[0][n] <= 0:
+            return None
+        S, T, HS, unpaired = self.S, self.T, self.HS, self.unpaired
+        out = bytearray(b"." * n)
+        w_dot = self.wu / self.scale
+        stack = [("S", 0, n)]
+        while stack:
+            symbol, i, j = stack.pop()
+            while i < j:
+                table = S if symbol == "S" else T
+                u = rng.random() * table[i][j]
+                dot = w_dot * S[i + 1][j] if unpaired[i] else 0.0
+                if u < dot:
+                    i, symbol = i + 1, "S"
+                    continue
+                if symbol == "S" and u >= dot + HS[i][j]:
+                    # Last helix of the loop, nothing after it
+                    m = j
+                else:
+                    m = self._draw_helix(i, j, rng)
+                out[i:i + h] = b"(" * h
+                out[m - h:m] = b")" * h
+                stack.append(("T", i + h, m - h))
+                i, symbol = m, "S"
+        return out.decode()
+
+def grammar_args(params):
+    """
+    Extracts (wu, ws, h, theta) from a config dict.
+    Accepts the key spellings used by the generation scripts:
+    w_unpaired/Wu/wu, w_stack/Ws/ws, h, theta (h and theta default to 3).
+    """
+    def pick(*keys, default=None):
+        for key in keys:
+            if key in params:
+                return params[key]
+        if default is None:
+            raise KeyError(f"Missing grammar parameter, expected one of {keys}")
+        return default
+    return (pick("w_unpaired", "Wu", "wu"), pick("w_stack", "Ws", "ws"),
+            pick("h", default=3), pick("theta", default=3))
+
+def sample_batch(grammar_params, L, n, seed=None, packed=False, backend="python", store=None):
+    """
+    Generates n structures of length L from one table build.
+    Uses its own random.Random, so runs are reproducible by seed and
+    concurrent calls from several threads do not share RNG state.
+    Inputs:
+        grammar_params: dict - Config dict with the grammar weights (see grammar_args), and optionally
+            a "mask" of length L to only draw structures satisfying it (see ConstrainedTables)
+        L: int - Length of every structure
+        n: int - Number of structures
+        seed: int, str or None - Seed of the dedicated random.Random
+        packed: bool - Return one bytearray of n*L characters (row i at [i*L:(i+1)*L])
+        backend: str - Table backend, "python" or "numpy"
+        store: TableStore, TableCache or None - Table cache shared between calls / runs
+    Outputs:
+        list of str or bytearray - The structures ([] / empty if the grammar has no structure of length L)
+    """
+    wu, ws, h, theta = grammar_args(grammar_params)
+    rng = random.Random(seed)
+    if grammar_params.get("mask"):
+        return _sample_masked(grammar_params["mask"], L, n, wu, ws, h, theta, rng, packed)
+    tables = build_tables(L, wu, ws, h, theta, backend=backend, store=store)
+    if tables.S[L] <= 0:
+        return bytearray() if packed else []
+    if packed:
+        out = bytearray(b"." * (n * L))
+        for i in range(n):
+            write_structure(tables, out, i * L, L, "S", rng)
+        return out
+    return list(islice(_iter_samples(tables, L, rng), n))
+
+def _sample_masked(mask, L, n, wu, ws, h, theta, rng, packed):
+    """sample_batch for a config with a "mask": one ConstrainedTables build, then n draws."""
+    if len(mask) != L:
+        raise ValueError(f"Mask has length {len(mask)}, expected L={L}")
+    tables = ConstrainedTables(mask, wu, ws, h, theta)
+    if tables.S[0][L] <= 0:
+        return bytearray() if packed else []
+    structures = [tables.sample(rng) for _ in range(n)]
+    return bytearray("".join(structures).encode()) if packed else structures
+
+def _iter_samples(tables, L, rng):
+    """Endless stream of structures of length L drawn from built tables."""
+    out = bytearray(L)
+    while True:
+        out[:] = b"." * L
+        write_structure(tables, out, 0, L, "S", rng)
+        yield out.decode()
+
+def iter_structures(grammar_params, L, n=None, seed=None, backend="python", store=None):
+    """
+    Lazily yields structures of length L from one table build.
+    Same draws as sample_batch for the same seed, without holding them in memory.
+    Inputs:
+        grammar_params: dict - Config dict with the grammar weights (see grammar_args)
+        L: int - Length of every structure
+        n: int or None - Number of structures (None: endless)
+        seed: int, str or None - Seed of the dedicated random.Random
+        backend: str - Table backend, "python" or "numpy"
+        store: TableStore, TableCache or None - Table cache shared between calls / runs
+    Outputs:
+        iterator of str - The structures (nothing if the grammar has no structure of length L)
+    """
+    wu, ws, h, theta = grammar_args(grammar_params)
+    tables = build_tables(L, wu, ws, h, theta, backend=backend, store=store)
+    if tables.S[L] <= 0:
+        return iter(())
+    return islice(_iter_samples(tables, L, random.Random(seed)), n)
+
+def unique_structures(structures, limit=None, max_attempts=None):
+    """
+    Drops repeated (and empty) structures from a stream.
+    Only a 16-byte digest of every structure seen is kept, so memory stays
+    small for long streams and each lookup is O(1). Two distinct structures
+    share a digest (and the second is dropped) with probability below
+    m^2 / 2^129 over m distinct structures, about 1e-21 for a billion.
+    Inputs:
+        structures: iterable of str - Input stream (e.g. iter_structures(...))
+        limit: int or None - Stop after this many distinct structures
+        max_attempts: int or None - Stop after reading this many input structures
+    Outputs:
+        iterator of str - Distinct structures in first-seen order
+    """
+    if limit is not None and limit <= 0:
+        return
+    seen = set()
+    for s in islice(structures, max_attempts):
+        if not s:
+            continue
+        key = hashlib.blake2b(s.encode(), digest_size=16).digest()
+        if key not in seen:
+            seen.add(key)
+            yield s
+            if limit is not None and len(seen) >= limit:
+                return
+
+def write_structures(structures, path, buffer_size=1 << 20):
+    """
+    Writes a stream of structures to a file, one per line, through a large write buffer.
+    Inputs:
+        structures: iterable of str - Structures (or already formatted lines)
+        path: str - Output file
+        buffer_size: int - Write buffer size in bytes
+    Outputs:
+        int - Number of lines written
+    """
+    count = 0
+    with open(path, "w", buffering=buffer_size) as f:
+        for s in structures:
+            f.write(s)
+            f.write("\n")
+            count += 1
+    return count
 
 def generateS(n, cache, wu, ws, h, theta):
     """
@@ -125,35 +723,9 @@ def generateS(n, cache, wu, ws, h, theta):
         str or None - Generated RNA secondary structure string (dot-bracket notation)
     """
     if n == 0: return ""
-    
-    total = countS(n, cache, wu, ws, h, theta)
-    if total == 0: return None # Should not happen for S unless constraints impossible
-    r = random.random() * total
-    
-    # 1. . S
-    if n >= 1:
-        term = wu * countS(n-1, cache, wu, ws, h, theta)
-        if r < term:
-            rest = generateS(n-1, cache, wu, ws, h, theta)
-            return "." + rest if rest is not None else "."
-        r -= term
-        
-    # 2. (*h T )*h S
-    if n >= 2*h + theta:
-        for k in range(theta, n - 2*h + 1):
-            term = ws * countT(k, cache, wu, ws, h, theta) * countS(n - 2*h - k, cache, wu, ws, h, theta)
-            if r < term:
-                inner = generateT(k, cache, wu, ws, h, theta)
-                rest = generateS(n - 2*h - k, cache, wu, ws, h, theta)
-                # Construct (*h ... )*h
-                return "(" * h + inner + ")" * h + rest
-            r -= term
-            
-    # Fallback/Rounding
-    # If we are here, it means floating point issues or 0 total.
-    # Return unpaired as default if possible
-    if n >= 1: return "." + generateS(n-1, cache, wu, ws, h, theta)
-    return ""
+    tables = _tables_for(n, cache, wu, ws, h, theta)
+    if tables.S[n] <= 0: return None # Should not happen for S unless constraints impossible
+    return sample_structure(tables, n, "S")
 
 def generateT(n, cache, wu, ws, h, theta):
     """
@@ -168,77 +740,11 @@ def generateT(n, cache, wu, ws, h, theta):
     Outputs:
         str or None - Generated internal RNA structure string (dot-bracket notation)
     """
-    # n >= theta check done by caller usually, but logic holds.
     # Note: T is strictly length n.
     if n < theta: return None 
-    
-    total = countT(n, cache, wu, ws, h, theta)
-    if total == 0: return None
-    r = random.random() * total
-    
-    # 1. . S
-    if n >= 1:
-        term = wu * countS(n-1, cache, wu, ws, h, theta)
-        if r < term:
-            rest = generateS(n-1, cache, wu, ws, h, theta)
-            return "." + rest
-        r -= term
-        
-    # 2. (*h T )*h . S
-    if n >= 2*h + theta + 1:
-        for k in range(theta, n - 2*h - 1 + 1):
-            rem = n - (2*h + k + 1)
-            term = ws * countT(k, cache, wu, ws, h, theta) * wu * countS(rem, cache, wu, ws, h, theta)
-            if r < term:
-                inner = generateT(k, cache, wu, ws, h, theta)
-                rest = generateS(rem, cache, wu, ws, h, theta)
-                return "(" * h + inner + ")" * h + "." + rest
-            r -= term
-
-    # 3. (*h T )*h (*h T )*h S
-    if n >= 4*h + 2*theta:
-        for k1 in range(theta, n - 4*h - theta + 1):
-            term1_val = ws * countT(k1, cache, wu, ws, h, theta)
-            
-            for k2 in range(theta, n - 4*h - k1 + 1):
-                rem = n - 4*h - k1 - k2
-                term = term1_val * ws * countT(k2, cache, wu, ws, h, theta) * countS(rem, cache, wu, ws, h, theta)
-                if r < term:
-                    inner1 = generateT(k1, cache, wu, ws, h, theta)
-                    inner2 = generateT(k2, cache, wu, ws, h, theta)
-                    rest = generateS(rem, cache, wu, ws, h, theta)
-                    return "(" * h + inner1 + ")" * h + "(" * h + inner2 + ")" * h + rest
-                r -= term
-                
-    return None # Should not happen if total > 0
-
-def decompose_helices(ss):
-    """
-    Decomposes a valid dot-bracket string into a dictionary of helices.
-    Inputs:
-        ss: str - RNA secondary structure in dot-bracket notation
-    Outputs:
-        tuple (dict, dict) - H (dict mapping helix_id to (start, end) indices) and C (dict mapping helix_id to base pair count)
-    """
-    p = []
-    res,H,C = {},{},{}
-    for i,c in enumerate(ss):
-        if c=="(":
-            p.append(i)
-        elif c== ")":
-            j = p.pop()
-            a,b = j,i
-            ii,jj = a+1,b-1
-            if (ii,jj) in res:
-                hid = res[(ii,jj)]
-                res[(a,b)] = hid
-                C[hid] += 1
-            else:
-                hid = 1+len(H)
-                res[(a,b)] = hid
-                H[hid] = (a,b)
-                C[hid] = 1
-    return H,C
+    tables = _tables_for(n, cache, wu, ws, h, theta)
+    if tables.T[n] <= 0: return None
+    return sample_structure(tables, n, "T")
 
 if __name__ == "__main__":
     # Define configurations: (Length, Weight Unpaired, Weight Stack, Name, Min Helix h, Min Loop theta)
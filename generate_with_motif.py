@@ -1,50 +1,113 @@
-import random
-import sys
+import grammar_engine
+from grammar_engine import GrammarSpec, Rule, decompose_helices, row_property
 
-# Increase recursion depth for deep structures
-sys.setrecursionlimit(20000)
+# Fixed motif inserted by rule 6 of T
+MOTIF = "((.(....)).)"
+
+def grammar_spec(wu, ws, wm, h, theta):
+    """
+    The motif grammar as engine rules.
+    Inputs:
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs
+        wm: float - Weight for motifs
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+    Outputs:
+        GrammarSpec
+    S -> . S | (*h T )*h S | eps
+    T -> . S | (*h T )*h . S | (*h T )*h (*h T )*h S | ( T ) | .*theta | Motif S     (T has length >= theta)
+    """
+    opening, closing = "(" * h, ")" * h
+    w_helix = ws**max(0, h-1)
+    rules = [
+        Rule("S", (".", "S"), wu),
+        Rule("S", (opening, "T", closing, "S"), w_helix),
+        Rule("S", ()),
+        Rule("T", (".", "S"), wu),
+        Rule("T", (opening, "T", closing, ".", "S"), w_helix * wu),
+        Rule("T", (opening, "T", closing, opening, "T", closing, "S"), w_helix * w_helix),
+        Rule("T", ("(", "T", ")"), ws),
+        Rule("T", ("." * theta,), wu**theta),
+        Rule("T", (MOTIF, "S"), wm, mark=1),
+    ]
+    return GrammarSpec(rules, min_len={"T": theta})
+
+class GrammarTables(grammar_engine.GrammarTables):
+    """
+    Engine tables of the motif grammar.
+    Attributes (besides those of grammar_engine.GrammarTables):
+        wu, ws, wm, h, theta: grammar parameters the tables were built for
+        S, T: row - S[n] / T[n] total weights for length n
+        U: row - U[n] total weight of T followed by S over length n (no helix weight)
+    """
+    S = row_property("S")
+    T = row_property("T")
+    U = row_property(("T", "S"))
+
+    def __init__(self, wu, ws, wm, h, theta, scaled=True, backend="python"):
+        self.wu, self.ws, self.wm, self.h, self.theta = wu, ws, wm, h, theta
+        super().__init__(grammar_spec(wu, ws, wm, h, theta), scaled, backend)
+
+def build_tables(L, wu, ws, wm, h, theta, scaled=True, backend="python", store=None):
+    """
+    Builds the motif grammar weight tables for all lengths 0..L.
+    Inputs:
+        L: int - Maximum length
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs
+        wm: float - Weight for motifs
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        scaled: bool - Keep rows in scaled-per-length units (no overflow for long L / large weights)
+        backend: str - "python" or "numpy" (vectorized slice products, needs numpy)
+        store: TableStore, TableCache or None - Table cache to load the tables from / save them to
+    Outputs:
+        GrammarTables - Reusable table object
+    """
+    tables = GrammarTables(wu, ws, wm, h, theta, scaled, backend)
+    if store is not None:
+        return store.get(tables, L)
+    return tables.extend(L)
+
+def _tables_for(n, cache, wu, ws, wm, h, theta):
+    """
+    Returns the GrammarTables stored in `cache`, built/extended to cover length n.
+    """
+    tables = cache.get("tables")
+    if tables is None:
+        tables = cache["tables"] = GrammarTables(wu, ws, wm, h, theta)
+    if tables.L < n:
+        tables.extend(n)
+    return tables
 
 def countS(n, cache, wu, ws, wm, h, theta):
     """
     Counts total weight of structures of length n starting with S.
     Inputs:
         n: int - Length of the sequence
-        cache: dict - Memoization dict
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
         wu: float - Weight for unpaired bases
         ws: float - Weight for base pairs
         wm: float - Weight for motifs
         h: int - Minimum helix length
         theta: int - Minimum loop length
     Outputs:
-        float - Total structure weight
+        float - Total structure weight (inf past float range, see GrammarTables.log_weight)
     S -> . S
     S -> (*h T )*h S  (Weight ws**h)
     S -> eps
     """
     if n == 0: return 1.0
-    if ("S", n) in cache: return cache[("S", n)]
-    
-    val = 0.0
-    
-    # 1. . S
-    if n >= 1:
-        val += wu * countS(n-1, cache, wu, ws, wm, h, theta)
-    
-    # 2. (*h T )*h S
-    if n >= 2*h + theta:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h + 1):
-            val += w_stack_start * countT(k, cache, wu, ws, wm, h, theta) * countS(n - 2*h - k, cache, wu, ws, wm, h, theta)
-            
-    cache[("S", n)] = val
-    return val
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta)
+    return tables.weight(tables.S, n)
 
 def countT(n, cache, wu, ws, wm, h, theta):
     """
     Counts total weight of internal loops / substructures of length n.
     Inputs:
         n: int - Length of the internal sequence
-        cache: dict - Memoization dict
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
         wu: float - Weight for unpaired bases
         ws: float - Weight for base pairs
         wm: float - Weight for motifs
@@ -60,44 +123,50 @@ def countT(n, cache, wu, ws, wm, h, theta):
     T -> Motif S (Weight wm)
     """
     if n < theta: return 0.0
-    if ("T", n) in cache: return cache[("T", n)]
-    
-    val = 0.0
-    
-    # 1. T -> . S
-    if n >= 1:
-        val += wu * countS(n-1, cache, wu, ws, wm, h, theta)
-        
-    # 2. T -> (*h T )*h . S
-    if n >= 2*h + theta + 1:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h - 1 + 1):
-            rem = n - (2*h + k + 1)
-            val += w_stack_start * countT(k, cache, wu, ws, wm, h, theta) * wu * countS(rem, cache, wu, ws, wm, h, theta)
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta)
+    return tables.weight(tables.T, n)
 
-    # 3. T -> (*h T )*h (*h T )*h S
-    if n >= 4*h + 2*theta:
-        w_stack_start_double = ws**(2 * max(0, h-1))
-        for k1 in range(theta, n - 4*h - theta + 1):
-            cT_k1 = countT(k1, cache, wu, ws, wm, h, theta)
-            for k2 in range(theta, n - 4*h - k1 + 1):
-                rem = n - 4*h - k1 - k2
-                val += w_stack_start_double * cT_k1 * countT(k2, cache, wu, ws, wm, h, theta) * countS(rem, cache, wu, ws, wm, h, theta)
-
-    # 4. T -> ( T )
-    if n >= 2 + theta:
-        val += ws * countT(n-2, cache, wu, ws, wm, h, theta)
-        
-    # 5. T -> .* theta
-    if n == theta:
-        val += wu**theta
+def countU(n, cache, wu, ws, wm, h, theta):
+    """
+    Counts total weight of T followed by S over length n (no helix weight).
+    Shared by every rule that places a helix before an S, which turns the
+    two-helix rule of countT into a single sum.
+    Inputs:
+        n: int - Length of the sequence
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs
+        wm: float - Weight for motifs
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+    Outputs:
+        float - Total weight
+    U -> T(k) S(n-k)
+    """
+    if n < theta: return 0.0
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta)
+    return tables.weight(tables.U, n)
 
-    # 6. T -> Motif S
-    if n >= 12:
-        val += wm * countS(n - 12, cache, wu, ws, wm, h, theta)
+def expected_statistics(n, wu, ws, wm, h, theta, backend="python"):
+    """
+    Exact mean and variance of the number of motifs and of the unpaired
+    fraction of the structures of length n (n >= 1), without sampling.
+    Outputs:
+        dict - "motifs" and "unpaired_fraction" -> (mean, variance)
+    """
+    stats = grammar_engine.feature_statistics(grammar_spec(wu, ws, wm, h, theta), n, {
+        "motifs": grammar_engine.mark_count, "unpaired": grammar_engine.unpaired_count}, backend=backend)
+    mean, var = stats.pop("unpaired")
+    stats["unpaired_fraction"] = (mean / n, var / n**2)
+    return stats
 
-    cache[("T", n)] = val
-    return val
+def sampleU(n, cache, wu, ws, wm, h, theta):
+    """
+    Draws the split point of U -> T(k) S(n-k) proportionally to T(k) * S(n-k).
+    Outputs:
+        int or None - Length k of the T part (the S part has length n-k)
+    """
+    return _tables_for(n, cache, wu, ws, wm, h, theta).draw(("T", "S"), n)
 
 def generateS(n, cache, wu, ws, wm, h, theta):
     """
@@ -114,29 +183,9 @@ def generateS(n, cache, wu, ws, wm, h, theta):
         str - Generated dot-bracket RNA representation
     """
     if n == 0: return ""
-    total = countS(n, cache, wu, ws, wm, h, theta)
-    if total <= 0: return "." * n 
-    r = random.random() * total
-    
-    # 1. . S
-    if n >= 1:
-        term = wu * countS(n-1, cache, wu, ws, wm, h, theta)
-        if r < term:
-            return "." + generateS(n-1, cache, wu, ws, wm, h, theta)
-        r -= term
-        
-    # 2. (*h T )*h S
-    if n >= 2*h + theta:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h + 1):
-            term = w_stack_start * countT(k, cache, wu, ws, wm, h, theta) * countS(n - 2*h - k, cache, wu, ws, wm, h, theta)
-            if r < term:
-                inner = generateT(k, cache, wu, ws, wm, h, theta)
-                rest = generateS(n - 2*h - k, cache, wu, ws, wm, h, theta)
-                return "(" * h + inner + ")" * h + rest
-            r -= term
-            
-    return "." + generateS(n-1, cache, wu, ws, wm, h, theta)
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta)
+    if tables.S[n] <= 0: return "." * n
+    return grammar_engine.sample_structure(tables, n, "S")
 
 def generateT(n, cache, wu, ws, wm, h, theta):
     """
@@ -152,92 +201,10 @@ def generateT(n, cache, wu, ws, wm, h, theta):
     Outputs:
         str or None - Generated dot-bracket RNA sub-structure
     """
-    if n < theta: return None 
-    total = countT(n, cache, wu, ws, wm, h, theta)
-    if total <= 0: return None
-    r = random.random() * total
-    
-    # 1. . S
-    if n >= 1:
-        term = wu * countS(n-1, cache, wu, ws, wm, h, theta)
-        if r < term:
-            return "." + generateS(n-1, cache, wu, ws, wm, h, theta)
-        r -= term
-        
-    # 2. (*h T )*h . S
-    if n >= 2*h + theta + 1:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h - 1 + 1):
-            rem = n - (2*h + k + 1)
-            term = w_stack_start * countT(k, cache, wu, ws, wm, h, theta) * wu * countS(rem, cache, wu, ws, wm, h, theta)
-            if r < term:
-                inner = generateT(k, cache, wu, ws, wm, h, theta)
-                rest = generateS(rem, cache, wu, ws, wm, h, theta)
-                return "(" * h + inner + ")" * h + "." + rest
-            r -= term
-
-    # 3. (*h T )*h (*h T )*h S
-    if n >= 4*h + 2*theta:
-        w_stack_start_double = ws**(2 * max(0, h-1))
-        for k1 in range(theta, n - 4*h - theta + 1):
-            cT_k1 = countT(k1, cache, wu, ws, wm, h, theta)
-            for k2 in range(theta, n - 4*h - k1 + 1):
-                rem = n - 4*h - k1 - k2
-                term = w_stack_start_double * cT_k1 * countT(k2, cache, wu, ws, wm, h, theta) * countS(rem, cache, wu, ws, wm, h, theta)
-                if r < term:
-                    inner1 = generateT(k1, cache, wu, ws, wm, h, theta)
-                    inner2 = generateT(k2, cache, wu, ws, wm, h, theta)
-                    rest = generateS(rem, cache, wu, ws, wm, h, theta)
-                    return "(" * h + inner1 + ")" * h + "(" * h + inner2 + ")" * h + rest
-                r -= term
-
-    # 4. ( T )
-    if n >= 2 + theta:
-        term = ws * countT(n-2, cache, wu, ws, wm, h, theta)
-        if r < term:
-            return "(" + generateT(n-2, cache, wu, ws, wm, h, theta) + ")"
-        r -= term
-        
-    # 5. .* theta
-    if n == theta:
-        return "." * theta
-        
-    # 6. T -> Motif S
-    if n >= 12:
-        term = wm * countS(n - 12, cache, wu, ws, wm, h, theta)
-        if r < term:
-            return "((.(....)).)" + generateS(n - 12, cache, wu, ws, wm, h, theta)
-        r -= term
-                
-    return None
-
-def decompose_helices(ss):
-    """
-    Decomposes an RNA structure string into its constituent helices.
-    Inputs:
-        ss: str - Dot-bracket notation string
-    Outputs:
-        tuple (dict, dict) - H (helix positions) and C (helix lengths/base pairs)
-    """
-    p = []
-    res,H,C = {},{},{}
-    for i,c in enumerate(ss):
-        if c=="(":
-            p.append(i)
-        elif c== ")":
-            j = p.pop()
-            a,b = j,i
-            ii,jj = a+1,b-1
-            if (ii,jj) in res:
-                hid = res[(ii,jj)]
-                res[(a,b)] = hid
-                C[hid] += 1
-            else:
-                hid = 1+len(H)
-                res[(a,b)] = hid
-                H[hid] = (a,b)
-                C[hid] = 1
-    return H,C
+    if n < theta: return None
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta)
+    if tables.T[n] <= 0: return None
+    return grammar_engine.sample_structure(tables, n, "T")
 
 if __name__ == "__main__":
     # Define configurations: (Length, Weight Unpaired, Weight Stack, Weight Motif, Name, Min Helix h, Min Loop theta)
@@ -1,16 +1,134 @@
 import random
-import sys
 import os
 
-# Increase recursion depth for deep structures
-sys.setrecursionlimit(20000)
+import grammar_engine
+from grammar_engine import GrammarSpec, Rule, row_property, write_structure
+
+class MotifLibrary:
+    """
+    Motif strings compiled once for the grammar.
+    Attributes:
+        motifs: list of str - Motif strings, '*' marks a hole filled by a T
+        parts: list of list of str - Fixed pieces of each motif between its stars
+        stars, fixed: list of int - Star count / fixed character count of each motif
+        max_stars: int - Largest star count (0 without motifs)
+    """
+    def __init__(self, motifs):
+        self.motifs = list(motifs)
+        self.parts = [motif.split('*') for motif in self.motifs]
+        self.stars = [len(parts) - 1 for parts in self.parts]
+        self.fixed = [len(motif) - stars for motif, stars in zip(self.motifs, self.stars)]
+        self.max_stars = max(self.stars, default=0)
+
+    def rule_items(self, i):
+        """Right-hand side of the T rule of motif i: its fixed pieces with a T in every hole, then S."""
+        items = [self.parts[i][0]]
+        for part in self.parts[i][1:]:
+            items += ["T", part]
+        return tuple(items) + ("S",)
+
+def grammar_spec(wu, ws, wm, h, theta, library):
+    """
+    The generic motif grammar as engine rules.
+    Motif rules are marked, so every structure carries its motif count. Motifs with
+    the same number of stars and fixed characters fall in one engine rule group, so
+    the tables only do one convolution per distinct shape.
+    Inputs:
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs
+        wm: float - Weight of every motif
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        library: MotifLibrary - Compiled motifs
+    Outputs:
+        GrammarSpec
+    S -> . S | (*h T )*h S | eps
+    T -> . S | (*h T )*h . S | (*h T )*h (*h T )*h S | ( T ) | .*theta | Motif_i S     (T has length >= theta)
+    with a T in every star of Motif_i, plus product rows T^s for s <= library.max_stars
+    """
+    opening, closing = "(" * h, ")" * h
+    w_helix = ws**max(0, h-1)
+    rules = [
+        Rule("S", (".", "S"), wu),
+        Rule("S", (opening, "T", closing, "S"), w_helix),
+        Rule("S", ()),
+        Rule("T", (".", "S"), wu),
+        Rule("T", (opening, "T", closing, ".", "S"), w_helix * wu),
+        Rule("T", (opening, "T", closing, opening, "T", closing, "S"), w_helix * w_helix),
+        Rule("T", ("(", "T", ")"), ws),
+        Rule("T", ("." * theta,), wu**theta),
+    ]
+    rules += [Rule("T", library.rule_items(i), wm, mark=1) for i in range(len(library.motifs))]
+    products = [("T",) * s for s in range(2, library.max_stars + 1)]
+    return GrammarSpec(rules, min_len={"T": theta}, products=products)
+
+def _library(motifs):
+    return motifs if isinstance(motifs, MotifLibrary) else MotifLibrary(motifs)
+
+class GrammarTables(grammar_engine.GrammarTables):
+    """
+    Engine tables of the generic motif grammar.
+    Attributes (besides those of grammar_engine.GrammarTables):
+        wu, ws, wm, h, theta, motifs: grammar parameters the tables were built for
+        library: MotifLibrary - Compiled motifs
+        S, T: row - S[n] / T[n] total weights for length n
+        U: row - U[n] total weight of T followed by S over length n (no helix weight)
+        T_stars: list of row - T_stars[s][n] total weight of s copies of T over length n
+    """
+    S = row_property("S")
+    T = row_property("T")
+    U = row_property(("T", "S"))
+
+    def __init__(self, wu, ws, wm, h, theta, motifs, scaled=True, backend="python"):
+        self.wu, self.ws, self.wm, self.h, self.theta = wu, ws, wm, h, theta
+        self.library = _library(motifs)
+        self.motifs = self.library.motifs
+        super().__init__(grammar_spec(wu, ws, wm, h, theta, self.library), scaled, backend)
+
+    @property
+    def T_stars(self):
+        empty = [1.0] + [0.0] * self.L
+        return [empty, self.T] + [self.rows[("T",) * s] for s in range(2, self.library.max_stars + 1)]
+
+def build_tables(L, wu, ws, wm, h, theta, motifs, scaled=True, backend="python", store=None):
+    """
+    Builds the generic motif grammar weight tables for all lengths 0..L.
+    Inputs:
+        L: int - Maximum length
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs
+        wm: float - Weight for motifs
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        motifs: list or MotifLibrary - Textual motif strings with any number of stars
+        scaled: bool - Keep rows in scaled-per-length units (no overflow for long L / large weights)
+        backend: str - "python" or "numpy" (vectorized slice products, needs numpy)
+        store: TableStore, TableCache or None - Table cache to load the tables from / save them to
+    Outputs:
+        GrammarTables - Reusable table object
+    """
+    tables = GrammarTables(wu, ws, wm, h, theta, motifs, scaled, backend)
+    if store is not None:
+        return store.get(tables, L)
+    return tables.extend(L)
+
+def _tables_for(n, cache, wu, ws, wm, h, theta, motifs):
+    """
+    Returns the GrammarTables stored in `cache`, built/extended to cover length n.
+    """
+    tables = cache.get("tables")
+    if tables is None:
+        tables = cache["tables"] = GrammarTables(wu, ws, wm, h, theta, motifs)
+    if tables.L < n:
+        tables.extend(n)
+    return tables
 
 def countS(n, cache, wu, ws, wm, h, theta, motifs):
     """
     Counts total weight of structures of length n starting with S.
     Inputs:
         n: int - Length of the sequence
-        cache: dict - Memoization dict to store previous calculations
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
         wu: float - Weight for unpaired bases
         ws: float - Weight for base pairs (stacks)
         wm: float - Weight for motifs from Motif array
@@ -24,22 +142,8 @@ def countS(n, cache, wu, ws, wm, h, theta, motifs):
     S -> eps
     """
     if n == 0: return 1.0
-    if ("S", n) in cache: return cache[("S", n)]
-    
-    val = 0.0
-    
-    # 1. . S
-    if n >= 1:
-        val += wu * countS(n-1, cache, wu, ws, wm, h, theta, motifs)
-    
-    # 2. (*h T )*h S
-    if n >= 2*h + theta:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h + 1):
-            val += w_stack_start * countT(k, cache, wu, ws, wm, h, theta, motifs) * countS(n - 2*h - k, cache, wu, ws, wm, h, theta, motifs)
-            
-    cache[("S", n)] = val
-    return val
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta, motifs)
+    return tables.weight(tables.S, n)
 
 def countT_stars(s, n, cache, wu, ws, wm, h, theta, motifs):
     """
@@ -50,24 +154,16 @@ def countT_stars(s, n, cache, wu, ws, wm, h, theta, motifs):
     """
     if s == 0:
         return 1.0 if n == 0 else 0.0
-        
-    key = ("T_stars", s, n)
-    if key in cache: return cache[key]
-    
-    val = 0.0
-    if n >= s * theta:
-        for k in range(theta, n - (s-1)*theta + 1):
-            val += countT(k, cache, wu, ws, wm, h, theta, motifs) * countT_stars(s-1, n-k, cache, wu, ws, wm, h, theta, motifs)
-        
-    cache[key] = val
-    return val
+    if n < s * theta: return 0.0
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta, motifs)
+    return tables.weight(tables.T_stars[s], n)
 
 def countT(n, cache, wu, ws, wm, h, theta, motifs):
     """
     Counts total weight of structures inside a helix (Grammar T).
     Inputs:
         n: int - Length of internal sequence block
-        cache: dict - Memoization cache
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
         wu: float - Weight for unpaired bases
         ws: float - Weight for base pairs
         wm: float - Weight for motifs
@@ -84,48 +180,51 @@ def countT(n, cache, wu, ws, wm, h, theta, motifs):
     T -> Motif S (Weight wm)
     """
     if n < theta: return 0.0
-    if ("T", n) in cache: return cache[("T", n)]
-    
-    val = 0.0
-    
-    # 1. T -> . S
-    if n >= 1:
-        val += wu * countS(n-1, cache, wu, ws, wm, h, theta, motifs)
-        
-    # 2. T -> (*h T )*h . S
-    if n >= 2*h + theta + 1:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h - 1 + 1):
-            rem = n - (2*h + k + 1)
-            val += w_stack_start * countT(k, cache, wu, ws, wm, h, theta, motifs) * wu * countS(rem, cache, wu, ws, wm, h, theta, motifs)
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta, motifs)
+    return tables.weight(tables.T, n)
 
-    # 3. T -> (*h T )*h (*h T )*h S
-    if n >= 4*h + 2*theta:
-        w_stack_start_double = ws**(2 * max(0, h-1))
-        for k1 in range(theta, n - 4*h - theta + 1):
-            cT_k1 = countT(k1, cache, wu, ws, wm, h, theta, motifs)
-            for k2 in range(theta, n - 4*h - k1 + 1):
-                rem = n - 4*h - k1 - k2
-                val += w_stack_start_double * cT_k1 * countT(k2, cache, wu, ws, wm, h, theta, motifs) * countS(rem, cache, wu, ws, wm, h, theta, motifs)
-
-    # 4. T -> ( T )
-    if n >= 2 + theta:
-        val += ws * countT(n-2, cache, wu, ws, wm, h, theta, motifs)
-        
-    # 5. T -> .* theta
-    if n == theta:
-        val += wu**theta
+def countU(n, cache, wu, ws, wm, h, theta, motifs):
+    """
+    Counts total weight of T followed by S over length n (no helix weight).
+    Shared by every rule that places a helix before an S, which turns the
+    two-helix rule of countT into a single sum.
+    Inputs:
+        n: int - Length of the sequence
+        cache: dict - Holds the GrammarTables shared between calls (key "tables")
+        wu: float - Weight for unpaired bases
+        ws: float - Weight for base pairs
+        wm: float - Weight for motifs
+        h: int - Minimum helix length
+        theta: int - Minimum loop length
+        motifs: list - Array of textual motif strings
+    Outputs:
+        float - Total weight
+    U -> T(k) S(n-k)
+    """
+    if n < theta: return 0.0
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta, motifs)
+    return tables.weight(tables.U, n)
 
-    # 6. Dynamic generic motifs via generalized recursion
-    for motif in motifs:
-        stars = motif.count('*')
-        L = len(motif) - stars
-        if n >= L + stars * theta:
-            for k in range(L + stars * theta, n + 1):
-                val += wm * countT_stars(stars, k - L, cache, wu, ws, wm, h, theta, motifs) * countS(n - k, cache, wu, ws, wm, h, theta, motifs)
+def expected_statistics(n, wu, ws, wm, h, theta, motifs, backend="python"):
+    """
+    Exact mean and variance of the number of motifs and of the unpaired
+    fraction of the structures of length n (n >= 1), without sampling.
+    Outputs:
+        dict - "motifs" and "unpaired_fraction" -> (mean, variance)
+    """
+    stats = grammar_engine.feature_statistics(grammar_spec(wu, ws, wm, h, theta, _library(motifs)), n, {
+        "motifs": grammar_engine.mark_count, "unpaired": grammar_engine.unpaired_count}, backend=backend)
+    mean, var = stats.pop("unpaired")
+    stats["unpaired_fraction"] = (mean / n, var / n**2)
+    return stats
 
-    cache[("T", n)] = val
-    return val
+def sampleU(n, cache, wu, ws, wm, h, theta, motifs):
+    """
+    Draws the split point of U -> T(k) S(n-k) proportionally to T(k) * S(n-k).
+    Outputs:
+        int or None - Length k of the T part (the S part has length n-k)
+    """
+    return _tables_for(n, cache, wu, ws, wm, h, theta, motifs).draw(("T", "S"), n)
 
 def generateS(n, cache, wu, ws, wm, h, theta, motifs):
     """
@@ -134,30 +233,11 @@ def generateS(n, cache, wu, ws, wm, h, theta, motifs):
         (str, int) - (Generated dot-bracket string, motif count)
     """
     if n == 0: return "", 0
-    total = countS(n, cache, wu, ws, wm, h, theta, motifs)
-    if total <= 0: return "." * n, 0
-    r = random.random() * total
-    
-    # 1. . S
-    if n >= 1:
-        term = wu * countS(n-1, cache, wu, ws, wm, h, theta, motifs)
-        if r < term:
-            rest_s, rest_c = generateS(n-1, cache, wu, ws, wm, h, theta, motifs)
-            return "." + rest_s, rest_c
-        r -= term
-        
-    # 2. (*h T )*h S
-    if n >= 2*h + theta:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h + 1):
-            term = w_stack_start * countT(k, cache, wu, ws, wm, h, theta, motifs) * countS(n - 2*h - k, cache, wu, ws, wm, h, theta, motifs)
-            if r < term:
-                inner_s, inner_c = generateT(k, cache, wu, ws, wm, h, theta, motifs)
-                rest_s, rest_c = generateS(n - 2*h - k, cache, wu, ws, wm, h, theta, motifs)
-                return "(" * h + inner_s + ")" * h + rest_s, inner_c + rest_c
-            r -= term
-            
-    return "." * n, 0
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta, motifs)
+    if tables.S[n] <= 0: return "." * n, 0
+    out = bytearray(n)
+    count = write_structure(tables, out, 0, n, "S")
+    return out.decode(), count
 
 def generateT_stars(s, n, cache, wu, ws, wm, h, theta, motifs):
     """
@@ -167,22 +247,8 @@ def generateT_stars(s, n, cache, wu, ws, wm, h, theta, motifs):
     """
     if s == 0:
         return ([] if n == 0 else None), 0
-        
-    total = countT_stars(s, n, cache, wu, ws, wm, h, theta, motifs)
-    if total <= 0: return None, 0
-    
-    r = random.random() * total
-    if n >= s * theta:
-        for k in range(theta, n - (s-1)*theta + 1):
-            term = countT(k, cache, wu, ws, wm, h, theta, motifs) * countT_stars(s-1, n-k, cache, wu, ws, wm, h, theta, motifs)
-            if r < term:
-                inner_s, inner_c = generateT(k, cache, wu, ws, wm, h, theta, motifs)
-                rest_inners, rest_c = generateT_stars(s-1, n-k, cache, wu, ws, wm, h, theta, motifs)
-                if rest_inners is not None:
-                    return [inner_s] + rest_inners, inner_c + rest_c
-                return None, 0
-            r -= term
-    return None, 0
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta, motifs)
+    return grammar_engine.sample_sequence(tables, ("T",) * s, n)
 
 def generateT(n, cache, wu, ws, wm, h, theta, motifs):
     """
@@ -191,105 +257,58 @@ def generateT(n, cache, wu, ws, wm, h, theta, motifs):
         (str, int) or (None, 0)
     """
     if n < theta: return None, 0
-    total = countT(n, cache, wu, ws, wm, h, theta, motifs)
-    if total <= 0: return None, 0
-    r = random.random() * total
-    
-    # 1. . S
-    if n >= 1:
-        term = wu * countS(n-1, cache, wu, ws, wm, h, theta, motifs)
-        if r < term:
-            rest_s, rest_c = generateS(n-1, cache, wu, ws, wm, h, theta, motifs)
-            return "." + rest_s, rest_c
-        r -= term
-        
-    # 2. (*h T )*h . S
-    if n >= 2*h + theta + 1:
-        w_stack_start = ws**max(0, h-1)
-        for k in range(theta, n - 2*h - 1 + 1):
-            rem = n - (2*h + k + 1)
-            term = w_stack_start * countT(k, cache, wu, ws, wm, h, theta, motifs) * wu * countS(rem, cache, wu, ws, wm, h, theta, motifs)
-            if r < term:
-                inner_s, inner_c = generateT(k, cache, wu, ws, wm, h, theta, motifs)
-                rest_s, rest_c = generateS(rem, cache, wu, ws, wm, h, theta, motifs)
-                return "(" * h + inner_s + ")" * h + "." + rest_s, inner_c + rest_c
-            r -= term
+    tables = _tables_for(n, cache, wu, ws, wm, h, theta, motifs)
+    if tables.T[n] <= 0: return None, 0
+    out = bytearray(n)
+    count = write_structure(tables, out, 0, n, "T")
+    return out.decode(), count
 
-    # 3. (*h T )*h (*h T )*h S
-    if n >= 4*h + 2*theta:
-        w_stack_start_double = ws**(2 * max(0, h-1))
-        for k1 in range(theta, n - 4*h - theta + 1):
-            cT_k1 = countT(k1, cache, wu, ws, wm, h, theta, motifs)
-            for k2 in range(theta, n - 4*h - k1 + 1):
-                rem = n - 4*h - k1 - k2
-                term = w_stack_start_double * cT_k1 * countT(k2, cache, wu, ws, wm, h, theta, motifs) * countS(rem, cache, wu, ws, wm, h, theta, motifs)
-                if r < term:
-                    inner1_s, inner1_c = generateT(k1, cache, wu, ws, wm, h, theta, motifs)
-                    inner2_s, inner2_c = generateT(k2, cache, wu, ws, wm, h, theta, motifs)
-                    rest_s, rest_c = generateS(rem, cache, wu, ws, wm, h, theta, motifs)
-                    return "(" * h + inner1_s + ")" * h + "(" * h + inner2_s + ")" * h + rest_s, inner1_c + inner2_c + rest_c
-                r -= term
+class CountTables(grammar_engine.CountTables):
+    """
+    Motif-count-indexed weight tables for the generic motif grammar (see grammar_engine.CountTables).
+    Row k < max_count holds the weight of structures with exactly k motifs, row
+    max_count the weight of structures with at least max_count motifs.
+    Attributes:
+        wu, ws, wm, h, theta, motifs, library: as in GrammarTables
+        max_count: int - Last (saturating) motif count
+        S, T, U: block - S[k][n], T[k][n], U[k][n]
+    """
+    S = row_property("S")
+    T = row_property("T")
+    U = row_property(("T", "S"))
 
-    # 4. ( T )
-    if n >= 2 + theta:
-        term = ws * countT(n-2, cache, wu, ws, wm, h, theta, motifs)
-        if r < term:
-            inner_s, inner_c = generateT(n-2, cache, wu, ws, wm, h, theta, motifs)
-            return "(" + inner_s + ")", inner_c
-        r -= term
-        
-    # 5. .* theta
-    if n == theta:
-        term = wu**theta
-        if r < term:
-            return "." * theta, 0
-        r -= term
+    def __init__(self, wu, ws, wm, h, theta, motifs, max_count, scaled=True, backend="python"):
+        self.wu, self.ws, self.wm, self.h, self.theta = wu, ws, wm, h, theta
+        self.library = _library(motifs)
+        self.motifs = self.library.motifs
+        super().__init__(grammar_spec(wu, ws, wm, h, theta, self.library), max_count, scaled, backend)
 
-    # 6. Dynamic generic motifs
-    for motif in motifs:
-        stars = motif.count('*')
-        L_rem = len(motif) - stars
-        if n >= L_rem + stars * theta:
-            for k in range(L_rem + stars * theta, n + 1):
-                term = wm * countT_stars(stars, k - L_rem, cache, wu, ws, wm, h, theta, motifs) * countS(n - k, cache, wu, ws, wm, h, theta, motifs)
-                if r < term:
-                    inners, inners_c = generateT_stars(stars, k - L_rem, cache, wu, ws, wm, h, theta, motifs)
-                    rest_s, rest_c = generateS(n - k, cache, wu, ws, wm, h, theta, motifs)
-                    
-                    motif_parts = motif.split('*')
-                    motif_str = motif_parts[0]
-                    if inners:
-                        for idx, inner in enumerate(inners):
-                            motif_str += inner + motif_parts[idx+1]
-                    
-                    return motif_str + rest_s, 1 + inners_c + rest_c
-                r -= term
-                
-    return None, 0
+def build_count_tables(L, wu, ws, wm, h, theta, motifs, max_count, scaled=True, backend="python"):
+    """
+    Builds the motif-count-indexed weight tables for all lengths 0..L.
+    Inputs:
+        L: int - Maximum length
+        wu, ws, wm, h, theta, motifs: Grammar parameters (see build_tables)
+        max_count: int - Counts 0..max_count-1 are exact, max_count means "at least max_count"
+        scaled: bool - Keep rows in scaled-per-length units (no overflow for long L / large weights)
+        backend: str - "python" or "numpy"
+    Outputs:
+        CountTables - Reusable table object
+    """
+    return CountTables(wu, ws, wm, h, theta, motifs, max_count, scaled, backend).extend(L)
 
-def decompose_helices(ss):
-    """
-    Decomposes an RNA sequence string and logs its constituent helices computationally.
-    """
-    p = []
-    res,H,C = {},{},{}
-    for i,c in enumerate(ss):
-        if c=="(":
-            p.append(i)
-        elif c== ")":
-            j = p.pop()
-            a,b = j,i
-            ii,jj = a+1,b-1
-            if (ii,jj) in res:
-                hid = res[(ii,jj)]
-                res[(a,b)] = hid
-                C[hid] += 1
-            else:
-                hid = 1+len(H)
-                res[(a,b)] = hid
-                H[hid] = (a,b)
-                C[hid] = 1
-    return H,C
+def sample_with_count(tables, n, k, rng=random):
+    """
+    Draws a structure of length n directly among those with a given motif count.
+    Inputs:
+        tables: CountTables - Tables covering length n
+        n: int - Length of the structure
+        k: int - Exactly k motifs if k < tables.max_count, at least k if k == tables.max_count
+        rng: random.Random - Random source
+    Outputs:
+        (str, int) or (None, 0) - (Dot-bracket string, motif count), None if no such structure exists
+    """
+    return grammar_engine.sample_with_count(tables, n, k, "S", rng)
 
 if __name__ == "__main__":
     import random
@@ -315,22 +334,21 @@ if __name__ == "__main__":
     
     with open(filename, "w") as f:
         for motif in SELECTED_MOTIFS:
-            cache = {}
             # structures will now store (string, count) tuples
             results = []
             print(f"Generating 50 structures for motif: {motif}")
-            total_weight = countS(L, cache, Wu, Ws, Wm, h, theta, [motif])
+            # Count bucket 1 of these tables holds every structure with at least one motif
+            tables = build_count_tables(L, Wu, Ws, Wm, h, theta, [motif], max_count=1)
             
             for i in range(N_PER_MOTIF):
-                s, c = generateS(L, cache, Wu, Ws, Wm, h, theta, [motif])
+                s, c = sample_with_count(tables, L, 1)
                 if s:
                     results.append((s, c))
                 else:
                     print(f"  Warning: Failed to generate structure {i}")
             
             for s, c in results:
-                if c > 0:
-                    f.write(f"{s},{c}\n")
+                f.write(f"{s},{c}\n")
                 
     print(f"Saved total 100 structures to {filename}")
     print("\nBatch generation complete.")
@@ -0,0 +1,1200 @@
+import copy
+import json
+import math
+import random
+from bisect import bisect_right
+from itertools import accumulate
+from operator import mul
+
+from table_backends import check_backend, conv, conv_block, conv_counts, copy_block, grow_block, log_conv_counts, new_block, np, rescale
+
+# Scaled tables are renormalised as soon as a start row leaves [1/SCALE_LIMIT, SCALE_LIMIT].
+SCALE_LIMIT = 2.0 ** 512
+
+class Rule:
+    """
+    One production of a grammar spec.
+    Attributes:
+        lhs: str - Nonterminal on the left-hand side
+        items: tuple of str - Right-hand side, nonterminal names or terminal strings ("((", ".", ...)
+        weight: float - Weight of the rule
+        mark: int - Added to the motif count of the structures using the rule (see CountTables)
+        layout: list - (is_nonterminal, name or encoded terminal) per item, set by GrammarSpec
+    """
+    def __init__(self, lhs, items=(), weight=1.0, mark=0):
+        self.lhs = lhs
+        self.items = tuple(item for item in items if item)
+        self.weight = weight
+        self.mark = mark
+        self.layout = None
+
+    def __repr__(self):
+        return f"Rule({self.lhs!r}, {self.items!r}, {self.weight!r}, {self.mark!r})"
+
+class RuleGroup:
+    """
+    Rules of one nonterminal that only differ by their terminal characters.
+    They use the same nonterminals in the same order, emit the same number of
+    terminal characters and have the same mark, so the tables only need their summed weight.
+    Attributes:
+        nts: tuple of str - Nonterminals of the right-hand sides, in order
+        fixed: int - Number of terminal characters
+        mark: int - Mark of the rules
+        row: str, tuple or None - Row giving the weight of the nonterminals (None for terminal-only rules)
+        rules: list of Rule
+        weight: float - Summed weight of the rules
+        cum: list of float - Cumulative rule weights, to draw a rule within the group
+        suffixes: list of tuple - Product rows used to split the length between the nonterminals
+    """
+    def __init__(self, nts, fixed, mark):
+        self.nts, self.fixed, self.mark = nts, fixed, mark
+        self.row = None if not nts else nts[0] if len(nts) == 1 else nts
+        self.suffixes = [nts[i:] for i in range(len(nts) - 1)]
+        self.rules = []
+        self.weight = 0.0
+        self.cum = []
+
+    def add(self, rule):
+        self.rules.append(rule)
+        self.weight += rule.weight
+        self.cum.append(self.weight)
+
+    def pick(self, rng):
+        """Draws one rule of the group proportionally to its weight."""
+        if len(self.rules) == 1:
+            return self.rules[0]
+        return self.rules[min(bisect_right(self.cum, rng.random() * self.weight), len(self.rules) - 1)]
+
+class GrammarSpec:
+    """
+    Declarative weighted grammar over dot-bracket strings, compiled once for the table builder and sampler.
+    Every rule that uses a nonterminal must also emit at least one character, so row n
+    only depends on rows of smaller lengths. Sequences of two or more nonterminals
+    (e.g. "T S" after a helix) get their own product rows, shared by all the rules ending with them.
+    Attributes:
+        rules: list of Rule
+        start: str - Start nonterminal (its row drives rescaling)
+        nonterminals: list of str - Left-hand sides in order of first appearance
+        min_len: dict - Minimum length of each nonterminal (its row is 0 below it)
+        groups: dict - Nonterminal -> list of RuleGroup
+        run: dict - Nonterminal N -> group of its rule N -> t N, unrolled by the sampler
+        products: list of tuple - Product rows, shortest first
+        powers: dict - Nonterminal N -> its power products (N, N), (N, N, N), ... up to the
+            longest one with all shorter powers (e.g. the star rows of motifs)
+        lo: dict - Smallest length with a possibly nonzero weight, for every row name
+        row_names: list - Nonterminals then products, the order rows are stored in
+    """
+    def __init__(self, rules, start="S", min_len=None, products=()):
+        self.rules = list(rules)
+        self.start = start
+        self.nonterminals = []
+        for rule in self.rules:
+            if rule.lhs not in self.nonterminals:
+                self.nonterminals.append(rule.lhs)
+        if start not in self.nonterminals:
+            raise ValueError(f"Start symbol '{start}' has no rule")
+        names = set(self.nonterminals)
+        self.min_len = {N: (min_len or {}).get(N, 0) for N in self.nonterminals}
+
+        self.groups = {N: [] for N in self.nonterminals}
+        index = {}
+        for rule in self.rules:
+            nts = tuple(item for item in rule.items if item in names)
+            fixed = sum(len(item) for item in rule.items if item not in names)
+            if nts and fixed == 0:
+                raise ValueError(f"{rule} uses nonterminals but emits no character")
+            rule.layout = [(item in names, item if item in names else item.encode()) for item in rule.items]
+            key = (rule.lhs, nts, fixed, rule.mark)
+            if key not in index:
+                index[key] = RuleGroup(nts, fixed, rule.mark)
+                self.groups[rule.lhs].append(index[key])
+            index[key].add(rule)
+
+        self.run = {}
+        for N, groups in self.groups.items():
+            for group in groups:
+                rule = group.rules[0]
+                if len(group.rules) == 1 and group.mark == 0 and len(rule.items) == 2 and rule.items[1] == N and group.nts == (N,):
+                    self.run[N] = group
+                    break
+
+        self.lo = {}
+        for N in self.nonterminals:
+            has_eps = any(group.row is None and group.fixed == 0 for group in self.groups[N])
+            self.lo[N] = max(self.min_len[N], 0 if has_eps else 1)
+        wanted = set(tuple(p) for p in products if len(p) >= 2)
+        for groups in self.groups.values():
+            for group in groups:
+                for i in range(len(group.nts) - 1):
+                    wanted.add(group.nts[i:])
+        for p in list(wanted):
+            if any(N not in names for N in p):
+                raise ValueError(f"Product {p} uses an unknown nonterminal")
+            for i in range(1, len(p) - 1):
+                wanted.add(p[i:])
+        self.products = sorted(wanted, key=lambda p: (len(p), p))
+        for p in self.products:
+            self.lo[p] = sum(self.lo[N] for N in p)
+        self.powers = {}
+        for p in self.products:
+            if len(set(p)) == 1 and (len(p) == 2 or p[1:] in self.powers.get(p[0], ())):
+                self.powers.setdefault(p[0], []).append(p)
+        self.row_names = self.nonterminals + self.products
+
+    def rest(self, product):
+        """Row name of a product without its first nonterminal."""
+        return product[1] if len(product) == 2 else product[1:]
+
+    def key(self):
+        """Canonical text of the spec: equal keys mean equal tables."""
+        return json.dumps({
+            "start": self.start,
+            "min_len": self.min_len,
+            "rules": [[r.lhs, list(r.items), float(r.weight), r.mark] for r in self.rules],
+            "products": [list(p) for p in self.products],
+        }, sort_keys=True)
+
+def row_property(name):
+    """Attribute alias for one table row (e.g. S = row_property("S"))."""
+    return property(lambda self: self.rows[name])
+
+class GrammarTables:
+    """
+    Array-backed weight tables of a GrammarSpec, filled bottom-up.
+    Attributes:
+        spec: GrammarSpec - Grammar the tables are built for
+        backend: str - "python" (lists) or "numpy" (one contiguous float64 block)
+        scaled: bool - Whether rows are kept in scaled-per-length units
+        scale: float - Row n holds (true weight) / scale**n; 1.0 until a rescale happens
+        L: int - Largest length currently covered by the tables
+        block: list of list or numpy.ndarray - All rows, in spec.row_names order
+        rows: dict - Row name (nonterminal or product tuple) -> row of `block`
+        group_weights: dict - Nonterminal -> summed weight of each rule group in table units
+    Every rule emits exactly n characters for a row of length n, so dividing each
+    emitted character by `scale` keeps all rules exact while the rows stay in
+    float range; sampling only compares terms within a row and is unaffected.
+    """
+    def __init__(self, spec, scaled=True, backend="python"):
+        self.spec = spec
+        self.backend = check_backend(backend)
+        self.scaled = scaled
+        self.scale = 1.0
+        self.L = -1
+        self.block = new_block(len(spec.row_names) * self.row_height(), backend)
+        self._bind_rows()
+        self._cdf = {}
+        self._set_rule_weights()
+
+    def row_height(self):
+        """Number of block rows per row name."""
+        return 1
+
+    def _bind_rows(self):
+        self.rows = dict(zip(self.spec.row_names, self.block))
+
+    def copy(self):
+        """
+        Copy of the tables with rows of its own (the spec is shared): extending the
+        copy leaves the original untouched for samplers still reading it.
+        """
+        other = copy.copy(self)
+        other.block = copy_block(self.block, self.backend)
+        other._bind_rows()
+        other._cdf = {}
+        return other
+
+    def _set_rule_weights(self):
+        """Rule weights in table units: every emitted character is divided by `scale`."""
+        c = self.scale
+        self.group_weights = {N: [group.weight / c**group.fixed for group in groups]
+                              for N, groups in self.spec.groups.items()}
+
+    def start_weight(self, n):
+        """Start row entry at n, in table units."""
+        return self.rows[self.spec.start][n]
+
+    def _rescale(self, n):
+        """
+        Picks a new scale so that the start row at n becomes 1 and rewrites every row with it.
+        Row i is multiplied by f**i, which keeps all rules homogeneous.
+        """
+        f = self.start_weight(n) ** (-1.0 / n)
+        for row in self.block:
+            rescale(row, n, f)
+        self._cdf.clear()
+        self.scale /= f
+        self._set_rule_weights()
+
+    def extend(self, L):
+        """
+        Computes the missing rows up to length L (inclusive).
+        Nonterminal rows at n only read rows at smaller lengths; product rows at n
+        are then one dot product each, shortest product first, except the powers of
+        a nonterminal, whose levels are all filled from the level below in one pass
+        (_fill_powers). The whole build is O(L^2).
+        Inputs:
+            L: int - Target maximum length
+        Outputs:
+            GrammarTables - self, for chaining
+        """
+        spec = self.spec
+        self.block = grow_block(self.block, L + 1, self.backend)
+        self._bind_rows()
+        rows, lo = self.rows, spec.lo
+        powers = {p for chain in spec.powers.values() for p in chain}
+        for n in range(self.L + 1, L + 1):
+            for N in spec.nonterminals:
+                total = 0.0
+                if n >= spec.min_len[N]:
+                    for group, w in zip(spec.groups[N], self.group_weights[N]):
+                        m = n - group.fixed
+                        if group.row is None:
+                            if m == 0:
+                                total += w
+                        elif m >= lo[group.row]:
+                            total += w * rows[group.row][m]
+                rows[N][n] = total
+            for N, chain in spec.powers.items():
+                self._fill_powers(N, chain, n)
+            for p in spec.products:
+                if p not in powers:
+                    rest = spec.rest(p)
+                    rows[p][n] = conv(rows[p[0]], rows[rest], n, lo[p[0]], lo[rest])
+
+            self.L = n
+            s = self.start_weight(n)
+            if self.scaled and n > 0 and (s > SCALE_LIMIT or 0.0 < s < 1.0 / SCALE_LIMIT):
+                self._rescale(n)
+        return self
+
+    def _fill_powers(self, N, chain, n):
+        """
+        Fills the power rows N^2..N^s of `chain` at n: N^k = N N^(k-1) for every level
+        at once, one matrix-vector product over the levels below for the numpy backend.
+        """
+        rows, lo = self.rows, self.spec.lo[N]
+        below = [N] + chain[:-1]
+        if self.backend == "numpy":
+            index = [self.spec.row_names.index(name) for name in below]
+            block = self.block[index, :n + 1]
+        else:
+            block = [rows[name] for name in below]
+        for p, v in zip(chain, conv_block(rows[N], block, n, max(lo, 1))):
+            rows[p][n] = v
+        if lo == 0:
+            # The empty N term reads the level below at n itself, so it is added level by level
+            for p, prev in zip(chain, below):
+                rows[p][n] += rows[N][0] * rows[prev][n]
+
+    def choices(self, symbol, n):
+        """
+        Choices a sampler has for `symbol` at length n, with their weights in table units.
+        Inputs:
+            symbol: str or tuple - Nonterminal or product row name
+            n: int - Length of the symbol
+        Outputs:
+            (list, list) - (choices, weights); only positive weights are listed.
+                Nonterminal: (runs, group index) - `runs` applications of the spec.run rule
+                    (e.g. leading unpaired bases of S) followed by a rule of the group
+                Product: k - Length of the first nonterminal
+        """
+        spec, rows, lo = self.spec, self.rows, self.spec.lo
+        out, weights = [], []
+        if isinstance(symbol, tuple):
+            rest = spec.rest(symbol)
+            for k in range(lo[symbol[0]], n - lo[rest] + 1):
+                w = rows[symbol[0]][k] * rows[rest][n - k]
+                if w > 0:
+                    out.append(k)
+                    weights.append(w)
+            return out, weights
+        groups, group_weights = spec.groups[symbol], self.group_weights[symbol]
+        run = spec.run.get(symbol)
+        if n < spec.min_len[symbol]:
+            return out, weights
+        max_runs = 0 if run is None else (n - spec.min_len[symbol]) // run.fixed
+        w_run = 0.0 if run is None else group_weights[groups.index(run)]
+        factor = 1.0
+        for runs in range(max_runs + 1):
+            base = n - runs * (run.fixed if run else 0)
+            for gi, (group, w) in enumerate(zip(groups, group_weights)):
+                if group is run:
+                    continue
+                m = base - group.fixed
+                if group.row is None:
+                    x = w if m == 0 else 0.0
+                elif m >= lo[group.row]:
+                    x = w * rows[group.row][m]
+                else:
+                    continue
+                if x > 0:
+                    out.append((runs, gi))
+                    weights.append(factor * x)
+            factor *= w_run
+        return out, weights
+
+    def cdf(self, symbol, n):
+        """
+        (choices, cumulative weights, total) of `symbol` at length n (see choices).
+        The last choice is repeated once more, so that a bisection landing past
+        the end (float rounding) still indexes a valid choice.
+        Built on first use and kept until the tables are rescaled.
+        """
+        key = (symbol, n)
+        c = self._cdf.get(key)
+        if c is None:
+            out, weights = self.choices(symbol, n)
+            cum = list(accumulate(map(float, weights)))
+            c = self._cdf[key] = (out + out[-1:], cum, cum[-1] if cum else 0.0)
+        return c
+
+    def draw(self, symbol, n, rng=random):
+        """
+        Draws a choice of `symbol` at length n by bisection on its cdf.
+        Inputs:
+            symbol: str or tuple - Nonterminal or product row name
+            n: int - Length of the symbol
+            rng: random.Random or module - Source of random.random() draws
+        Outputs:
+            choice (see choices) or None if the total weight is 0
+        """
+        out, cum, total = self.cdf(symbol, n)
+        if total <= 0:
+            return None
+        return out[bisect_right(cum, rng.random() * total)]
+
+    def weight(self, row, n):
+        """
+        Converts row[n] back to a true weight.
+        Inputs:
+            row: row - One of the rows
+            n: int - Length index
+        Outputs:
+            float - True weight (inf if it does not fit in a float)
+        """
+        x = float(row[n])
+        if self.scale == 1.0 or x == 0.0:
+            return x
+        try:
+            return math.exp(math.log(x) + n * math.log(self.scale))
+        except OverflowError:
+            return math.inf
+
+    def log_weight(self, n):
+        """
+        Natural logarithm of the total weight of start structures of length n.
+        Finite even when the true weight overflows a float (-inf if it is 0).
+        """
+        x = float(self.start_weight(n))
+        if x == 0.0:
+            return -math.inf
+        return math.log(x) + n * math.log(self.scale)
+
+def build_tables(spec, L, scaled=True, backend="python", store=None):
+    """
+    Builds the tables of a grammar spec for all lengths 0..L.
+    Inputs:
+        spec: GrammarSpec - Grammar
+        L: int - Maximum length
+        scaled: bool - Keep rows in scaled-per-length units (no overflow for long L / large weights)
+        backend: str - "python" or "numpy" (vectorized slice products, needs numpy)
+        store: TableStore, TableCache or None - Table cache to load the tables from / save them to
+    Outputs:
+        GrammarTables - Reusable table object
+    """
+    tables = GrammarTables(spec, scaled, backend)
+    if store is not None:
+        return store.get(tables, L)
+    return tables.extend(L)
+
+def _split(tables, group, n, rng):
+    """Draws the lengths of the nonterminals of a rule group sharing length n."""
+    lengths = []
+    for suffix in group.suffixes:
+        k = tables.draw(suffix, n, rng)
+        lengths.append(k)
+        n -= k
+    lengths.append(n)
+    return lengths
+
+def write_structure(tables, out, start, n, symbol=None, rng=random):
+    """
+    Draws one structure of length n derived from `symbol` into out[start:start+n].
+    Pending symbols live on an explicit stack of (symbol, position, length)
+    entries, so deep structures need no recursion.
+    Inputs:
+        tables: GrammarTables - Tables covering length n (with a nonzero weight for symbol at n)
+        out: bytearray - Output buffer
+        start: int - Position of the structure in `out`
+        n: int - Length of the structure
+        symbol: str or None - Nonterminal to derive (spec.start by default)
+        rng: random.Random or module - Source of random draws
+    Outputs:
+        int - Sum of the marks of the rules used (motif count)
+    """
+    spec = tables.spec
+    groups, cdfs, rand = spec.groups, tables._cdf, rng.random
+    marks = 0
+    stack = [(symbol or spec.start, start, n)]
+    while stack:
+        symbol, pos, n = stack.pop()
+        choices, cum, total = cdfs.get((symbol, n)) or tables.cdf(symbol, n)
+        if total <= 0:
+            raise ValueError(f"No structure of length {n} derives from {symbol}")
+        runs, gi = choices[bisect_right(cum, rand() * total)]
+        if runs:
+            unit = spec.run[symbol].rules[0].layout[0][1]
+            out[pos:pos + runs * len(unit)] = unit * runs
+            pos += runs * len(unit)
+            n -= runs * len(unit)
+        group = groups[symbol][gi]
+        rule = group.rules[0] if len(group.rules) == 1 else group.pick(rng)
+        marks += rule.mark
+        m = n - group.fixed
+        if not group.suffixes:
+            lengths = (m,)
+        else:
+            lengths = []
+            for suffix in group.suffixes:
+                split, split_cum, split_total = cdfs.get((suffix, m)) or tables.cdf(suffix, m)
+                k = split[bisect_right(split_cum, rand() * split_total)]
+                lengths.append(k)
+                m -= k
+            lengths.append(m)
+        # Terminals are written now; nonterminals are pushed right to left so the leftmost is expanded first
+        end = pos + n
+        j = len(lengths)
+        for is_nt, item in reversed(rule.layout):
+            if is_nt:
+                j -= 1
+                k = lengths[j]
+                end -= k
+                if k:
+                    stack.append((item, end, k))
+            else:
+                out[end - len(item):end] = item
+                end -= len(item)
+    return marks
+
+def sample_structure(tables, n, symbol=None, rng=random):
+    """
+    Draws one structure of length n derived from `symbol` without recursion.
+    Outputs:
+        str or None - Dot-bracket structure, None if no structure of length n derives from symbol
+    """
+    symbol = symbol or tables.spec.start
+    if n == 0:
+        return "" if tables.rows[symbol][0] > 0 else None
+    if tables.rows[symbol][n] <= 0:
+        return None
+    out = bytearray(n)
+    write_structure(tables, out, 0, n, symbol, rng)
+    return out.decode()
+
+def sample_sequence(tables, nts, n, rng=random):
+    """
+    Draws structures for a sequence of nonterminals sharing length n.
+    The sequence must be a row of the tables (a nonterminal or one of spec.products).
+    Outputs:
+        (list of str, int) or (None, 0) - (One structure per nonterminal, sum of marks)
+    """
+    row = nts[0] if len(nts) == 1 else tuple(nts)
+    if n < tables.spec.lo[row] or tables.rows[row][n] <= 0:
+        return None, 0
+    marks = 0
+    parts = []
+    lengths = _split(tables, RuleGroup(tuple(nts), 0, 0), n, rng) if len(nts) > 1 else [n]
+    for symbol, k in zip(nts, lengths):
+        out = bytearray(k)
+        if k:
+            marks += write_structure(tables, out, 0, k, symbol, rng)
+        parts.append(out.decode())
+    return parts, marks
+
+class CountTables(GrammarTables):
+    """
+    Mark-count-indexed tables of a GrammarSpec (marks count motifs).
+    Every row becomes max_count + 1 rows: row k < max_count holds the weight of
+    structures whose rules add up to exactly k marks, row max_count the weight of
+    those with at least max_count. Sampling from one of them draws directly among
+    the structures with that count, without rejection.
+    Attributes (besides those of GrammarTables):
+        max_count: int - Last (saturating) count
+        rows: dict - Row name -> block of max_count + 1 rows, rows[name][k][n]
+    """
+    def __init__(self, spec, max_count, scaled=True, backend="python"):
+        self.max_count = max_count
+        super().__init__(spec, scaled, backend)
+
+    def row_height(self):
+        return self.max_count + 1
+
+    def _bind_rows(self):
+        K = self.max_count + 1
+        self.rows = {name: self.block[i * K:(i + 1) * K] for i, name in enumerate(self.spec.row_names)}
+
+    def start_weight(self, n, k=None):
+        """Start row entry at n for count k (all counts if k is None), in table units."""
+        rows = self.rows[self.spec.start]
+        return sum(row[n] for row in rows) if k is None else rows[k][n]
+
+    def extend(self, L):
+        """
+        Computes the missing rows up to length L (inclusive) for every count.
+        Outputs:
+            CountTables - self, for chaining
+        """
+        spec, K = self.spec, self.max_count
+        self.block = grow_block(self.block, L + 1, self.backend)
+        self._bind_rows()
+        rows, lo = self.rows, spec.lo
+        for n in range(self.L + 1, L + 1):
+            for N in spec.nonterminals:
+                t = [0.0] * (K + 1)
+                if n >= spec.min_len[N]:
+                    for group, w in zip(spec.groups[N], self.group_weights[N]):
+                        m = n - group.fixed
+                        if group.row is None:
+                            if m == 0:
+                                t[min(group.mark, K)] += w
+                        elif m >= lo[group.row]:
+                            block = rows[group.row]
+                            for j in range(K + 1):
+                                t[min(j + group.mark, K)] += w * block[j][m]
+                for k in range(K + 1):
+                    rows[N][k][n] = t[k]
+            for p in spec.products:
+                rest = spec.rest(p)
+                for k, v in enumerate(conv_counts(rows[p[0]], rows[rest], n, lo[p[0]], lo[rest], K)):
+                    rows[p][k][n] = v
+
+            self.L = n
+            s = self.start_weight(n)
+            if self.scaled and n > 0 and (s > SCALE_LIMIT or 0.0 < s < 1.0 / SCALE_LIMIT):
+                self._rescale(n)
+        return self
+
+    def log_weight(self, n, k=None):
+        """
+        Natural logarithm of the total weight of start structures of length n with count k
+        (all counts if k is None), -inf if 0.
+        """
+        x = float(self.start_weight(n, k))
+        if x == 0.0:
+            return -math.inf
+        return math.log(x) + n * math.log(self.scale)
+
+def build_count_tables(spec, L, max_count, scaled=True, backend="python"):
+    """
+    Builds the mark-count-indexed tables of a grammar spec for all lengths 0..L.
+    Inputs:
+        spec: GrammarSpec - Grammar (rules with mark=1 are counted)
+        L: int - Maximum length
+        max_count: int - Counts 0..max_count-1 are exact, max_count means "at least max_count"
+        scaled: bool - Keep rows in scaled-per-length units
+        backend: str - "python" or "numpy"
+    Outputs:
+        CountTables - Reusable table object
+    """
+    return CountTables(spec, max_count, scaled, backend).extend(L)
+
+def _add_marks(column, mark, K):
+    """Moves the entries of a log count column up by `mark` counts, saturating at K."""
+    if mark == 0:
+        return column
+    m = min(mark, K)
+    out = np.full(K + 1, -np.inf)
+    out[m:K] = column[:K - m]
+    out[K] = np.logaddexp.reduce(column[K - m:])
+    return out
+
+class LogCountTables:
+    """
+    Mark-count-indexed tables of a GrammarSpec kept as natural logs (-inf for 0), numpy only.
+    They hold the same values as CountTables, but the scaled float tables share one scale
+    per length, so for long lengths the counts far from the typical one underflow there.
+    Here every entry keeps full relative precision, at any length.
+    Attributes:
+        spec: GrammarSpec - Grammar (rules with mark=1 are counted)
+        max_count: int - Last (saturating) count
+        L: int - Largest length covered
+        rows: dict - Row name -> numpy.ndarray, rows[name][k, n] is the log weight for count k
+    """
+    def __init__(self, spec, max_count):
+        check_backend("numpy")
+        self.spec = spec
+        self.max_count = max_count
+        self.L = -1
+        self.rows = {name: np.full((max_count + 1, 0), -np.inf) for name in spec.row_names}
+        self.group_weights = {N: [math.log(group.weight) if group.weight > 0 else -math.inf for group in groups]
+                              for N, groups in spec.groups.items()}
+
+    def extend(self, L):
+        """
+        Computes the missing rows up to length L (inclusive), same recurrences as CountTables.extend.
+        Outputs:
+            LogCountTables - self, for chaining
+        """
+        spec, K, lo = self.spec, self.max_count, self.spec.lo
+        for name, block in self.rows.items():
+            if block.shape[1] < L + 1:
+                self.rows[name] = np.hstack([block, np.full((K + 1, L + 1 - block.shape[1]), -np.inf)])
+        rows = self.rows
+        for n in range(self.L + 1, L + 1):
+            for N in spec.nonterminals:
+                terms = []
+                if n >= spec.min_len[N]:
+                    for group, w in zip(spec.groups[N], self.group_weights[N]):
+                        m = n - group.fixed
+                        if group.row is None:
+                            if m == 0:
+                                term = np.full(K + 1, -np.inf)
+                                term[min(group.mark, K)] = w
+                                terms.append(term)
+                        elif m >= lo[group.row]:
+                            terms.append(w + _add_marks(rows[group.row][:, m], group.mark, K))
+                rows[N][:, n] = np.logaddexp.reduce(terms, axis=0) if terms else -np.inf
+            for p in spec.products:
+                rest = spec.rest(p)
+                rows[p][:, n] = log_conv_counts(rows[p[0]], rows[rest], n, lo[p[0]], lo[rest], K)
+            self.L = n
+        return self
+
+    def log_weight(self, n, k=None):
+        """
+        Natural logarithm of the total weight of start structures of length n with count k
+        (all counts if k is None), -inf if 0.
+        """
+        column = self.rows[self.spec.start][:, n]
+        return float(np.logaddexp.reduce(column) if k is None else column[k])
+
+def _draw_split(tables, nts, n, counts, rng):
+    """
+    Draws the lengths and counts of a sequence of nonterminals over n whose counts
+    add up (saturating) to one of `counts`.
+    Outputs:
+        (list of int, list of int) - Lengths and counts, one per nonterminal
+    """
+    spec, K = tables.spec, tables.max_count
+    if len(nts) == 1:
+        block = tables.rows[nts[0]]
+        ks = [k for k in counts if block[k][n] > 0]
+        r = rng.random() * sum(block[k][n] for k in ks)
+        for k in ks:
+            if r < block[k][n]:
+                return [n], [k]
+            r -= block[k][n]
+        return [n], [ks[-1]]
+    first, rest = nts[0], spec.rest(nts)
+    A, B = tables.rows[first], tables.rows[rest]
+    lo_a, lo_b = spec.lo[first], spec.lo[rest]
+    pairs = [(i, j) for i in range(K + 1) for j in range(K + 1) if min(i + j, K) in counts]
+    total = sum(conv(A[i], B[j], n, lo_a, lo_b) for i, j in pairs)
+    r = rng.random() * total
+    last = None
+    for i, j in pairs:
+        for m in range(lo_a, n - lo_b + 1):
+            term = A[i][m] * B[j][n - m]
+            if term > 0:
+                last = (m, i, j)
+            if r < term:
+                break
+            r -= term
+        else:
+            continue
+        break
+    else:
+        m, i, j = last
+    lengths, ks = _draw_split(tables, nts[1:], n - m, (j,), rng)
+    return [m] + lengths, [i] + ks
+
+def write_counted(tables, out, start, n, k, symbol=None, rng=random):
+    """
+    Draws one structure of length n derived from `symbol` with count k into out[start:start+n].
+    Outputs:
+        int - Actual sum of the marks of the rules used (k or more in the saturating row)
+    """
+    spec, K = tables.spec, tables.max_count
+    marks = 0
+    stack = [(symbol or spec.start, start, n, k)]
+    while stack:
+        symbol, pos, n, k = stack.pop()
+        options, weights = [], []
+        groups = spec.groups[symbol] if n >= spec.min_len[symbol] else []
+        for gi, (group, w) in enumerate(zip(groups, tables.group_weights[symbol])):
+            m = n - group.fixed
+            if group.row is None:
+                if m == 0 and min(group.mark, K) == k:
+                    options.append((gi, ()))
+                    weights.append(w)
+            elif m >= spec.lo[group.row]:
+                inner = tuple(j for j in range(K + 1) if min(j + group.mark, K) == k)
+                x = w * sum(tables.rows[group.row][j][m] for j in inner)
+                if x > 0:
+                    options.append((gi, inner))
+                    weights.append(x)
+        if not options:
+            raise ValueError(f"No structure of length {n} and count {k} derives from {symbol}")
+        r = rng.random() * sum(weights)
+        for (gi, inner), w in zip(options, weights):
+            if r < w:
+                break
+            r -= w
+        group = spec.groups[symbol][gi]
+        rule = group.pick(rng)
+        marks += rule.mark
+        if group.nts:
+            lengths, ks = _draw_split(tables, group.nts, n - group.fixed, inner, rng)
+        else:
+            lengths, ks = [], []
+        sizes = iter(zip(lengths, ks))
+        pending = []
+        for is_nt, item in rule.layout:
+            if is_nt:
+                size, count = next(sizes)
+                if size:
+                    pending.append((item, pos, size, count))
+                pos += size
+            else:
+                out[pos:pos + len(item)] = item
+                pos += len(item)
+        stack.extend(reversed(pending))
+    return marks
+
+def sample_with_count(tables, n, k, symbol=None, rng=random):
+    """
+    Draws a structure of length n directly among those with a given count.
+    Inputs:
+        tables: CountTables - Tables covering length n
+        n: int - Length of the structure
+        k: int - Exactly k marks if k < tables.max_count, at least k if k == tables.max_count
+        symbol: str or None - Nonterminal to derive (spec.start by default)
+        rng: random.Random or module - Source of random draws
+    Outputs:
+        (str, int) or (None, 0) - (Dot-bracket string, count), None if no such structure exists
+    """
+    symbol = symbol or tables.spec.start
+    if tables.rows[symbol][k][n] <= 0:
+        return None, 0
+    out = bytearray(n)
+    marks = write_counted(tables, out, 0, n, k, symbol, rng) if n else 0
+    return out.decode(), marks
+
+def mark_count(rule):
+    """Feature of a rule: its mark (motifs or helices, depending on the grammar)."""
+    return rule.mark
+
+def unpaired_count(rule):
+    """Feature of a rule: number of unpaired bases it emits."""
+    return sum(item.count(b".") for is_nt, item in rule.layout if not is_nt)
+
+class MomentTables(GrammarTables):
+    """
+    Tables of the first two moments of an additive structure feature (unpaired bases, motifs, ...).
+    Every rule adds feature(rule) to the value of the structures using it. Each row
+    becomes three rows: Z (total weight), Z1 (sum of weight * value) and Z2 (sum of
+    weight * value**2), filled with the same recurrences as the weights in the
+    second-order expectation semiring. The exact mean and variance of the feature at
+    every length then come from one O(L^2) pass, without sampling.
+    Attributes (besides those of GrammarTables):
+        feature: callable - Rule -> number
+        group_moments: dict - Nonterminal -> (w0, w1, w2) per rule group, in table units
+        rows: dict - Row name -> [Z, Z1, Z2]
+    """
+    def __init__(self, spec, feature, scaled=True, backend="python"):
+        self.feature = feature
+        super().__init__(spec, scaled, backend)
+
+    def row_height(self):
+        return 3
+
+    def _bind_rows(self):
+        self.rows = {name: self.block[3 * i:3 * i + 3] for i, name in enumerate(self.spec.row_names)}
+
+    def _set_rule_weights(self):
+        super()._set_rule_weights()
+        c = self.scale
+        self.group_moments = {}
+        for N, groups in self.spec.groups.items():
+            self.group_moments[N] = [
+                tuple(sum(rule.weight * self.feature(rule)**j for rule in group.rules) / c**group.fixed for j in range(3))
+                for group in groups]
+
+    def start_weight(self, n):
+        return self.rows[self.spec.start][0][n]
+
+    def extend(self, L):
+        """
+        Computes the missing rows up to length L (inclusive) for the three moments.
+        Outputs:
+            MomentTables - self, for chaining
+        """
+        spec = self.spec
+        self.block = grow_block(self.block, L + 1, self.backend)
+        self._bind_rows()
+        rows, lo = self.rows, spec.lo
+        for n in range(self.L + 1, L + 1):
+            for N in spec.nonterminals:
+                z0 = z1 = z2 = 0.0
+                if n >= spec.min_len[N]:
+                    for group, (w0, w1, w2) in zip(spec.groups[N], self.group_moments[N]):
+                        m = n - group.fixed
+                        if group.row is None:
+                            if m == 0:
+                                z0, z1, z2 = z0 + w0, z1 + w1, z2 + w2
+                        elif m >= lo[group.row]:
+                            r0, r1, r2 = (row[m] for row in rows[group.row])
+                            z0 += w0 * r0
+                            z1 += w0 * r1 + w1 * r0
+                            z2 += w0 * r2 + 2 * w1 * r1 + w2 * r0
+                Z = rows[N]
+                Z[0][n], Z[1][n], Z[2][n] = z0, z1, z2
+            for p in spec.products:
+                rest = spec.rest(p)
+                (A0, A1, A2), (B0, B1, B2) = rows[p[0]], rows[rest]
+                la, lb = lo[p[0]], lo[rest]
+                Z = rows[p]
+                Z[0][n] = conv(A0, B0, n, la, lb)
+                Z[1][n] = conv(A0, B1, n, la, lb) + conv(A1, B0, n, la, lb)
+                Z[2][n] = conv(A0, B2, n, la, lb) + 2 * conv(A1, B1, n, la, lb) + conv(A2, B0, n, la, lb)
+
+            self.L = n
+            s = self.start_weight(n)
+            if self.scaled and n > 0 and (s > SCALE_LIMIT or 0.0 < s < 1.0 / SCALE_LIMIT):
+                self._rescale(n)
+        return self
+
+    def moments(self, n, symbol=None):
+        """
+        Mean and variance of the feature over the structures of length n derived from symbol.
+        Outputs:
+            (float, float) - (mean, variance), NaNs if no structure of length n exists
+        """
+        z0, z1, z2 = (float(row[n]) for row in self.rows[symbol or self.spec.start])
+        if z0 == 0.0:
+            return math.nan, math.nan
+        mean = z1 / z0
+        return mean, max(z2 / z0 - mean * mean, 0.0)
+
+def feature_statistics(spec, n, features, scaled=True, backend="python"):
+    """
+    Exact means and variances of additive structure features at length n.
+    Inputs:
+        spec: GrammarSpec - Grammar
+        n: int - Structure length
+        features: dict - Name -> feature (callable Rule -> number, e.g. unpaired_count)
+        scaled: bool - Keep rows in scaled-per-length units
+        backend: str - "python" or "numpy"
+    Outputs:
+        dict - Name -> (mean, variance)
+    """
+    return {name: MomentTables(spec, feature, scaled, backend).extend(n).moments(n)
+            for name, feature in features.items()}
+
+class ExactTables:
+    """
+    Exact integer tables of a GrammarSpec with integer rule weights (a rule of weight w
+    counts as w derivations). With all weights 1 and an unambiguous grammar the rows
+    count structures, and unrank / rank index them bijectively with Python ints.
+    Attributes:
+        spec: GrammarSpec - Grammar
+        L: int - Largest length covered
+        rows: dict - Row name -> list of int
+        group_weights: dict - Nonterminal -> integer weight of each rule group
+        rule_offsets: dict - Rule -> (group index, summed weight of the earlier rules of its group)
+        singles: dict - (symbol, n) -> the only structure of rows with a count of 1 (filled by the enumerator)
+    """
+    def __init__(self, spec):
+        self.spec = spec
+        self.L = -1
+        self.rows = {name: [] for name in spec.row_names}
+        self.singles = {}
+        self.group_weights, self.rule_offsets = {}, {}
+        for N, groups in spec.groups.items():
+            self.group_weights[N] = []
+            for gi, group in enumerate(groups):
+                total = 0
+                for rule in group.rules:
+                    if rule.weight < 0 or rule.weight != int(rule.weight):
+                        raise ValueError(f"{rule} needs a non-negative integer weight for exact counting")
+                    self.rule_offsets[rule] = (gi, total)
+                    total += int(rule.weight)
+                self.group_weights[N].append(total)
+
+    def extend(self, L):
+        """
+        Computes the missing rows up to length L (inclusive), same recurrences as GrammarTables.extend.
+        Outputs:
+            ExactTables - self, for chaining
+        """
+        spec, rows, lo = self.spec, self.rows, self.spec.lo
+        for row in rows.values():
+            row.extend([0] * (L + 1 - len(row)))
+        for n in range(self.L + 1, L + 1):
+            for N in spec.nonterminals:
+                rows[N][n] = sum(w * self.group_count(group, n)
+                                 for group, w in zip(spec.groups[N], self.group_weights[N])) if n >= spec.min_len[N] else 0
+            for p in spec.products:
+                rest = spec.rest(p)
+                lo_a, hi = lo[p[0]], n - lo[rest]
+                rows[p][n] = sum(map(mul, rows[p[0]][lo_a:hi + 1], reversed(rows[rest][lo[rest]:n - lo_a + 1]))) if hi >= lo_a else 0
+            self.L = n
+        return self
+
+    def group_count(self, group, n):
+        """Number of ways the nonterminals of a rule group fill length n minus its terminals."""
+        m = n - group.fixed
+        if group.row is None:
+            return 1 if m == 0 else 0
+        return self.rows[group.row][m] if m >= self.spec.lo[group.row] else 0
+
+    def count(self, n, symbol=None):
+        """Number of structures of length n derived from symbol (spec.start by default)."""
+        return self.rows[symbol or self.spec.start][n]
+
+def _unrank_sequence(tables, group, m, i):
+    """Splits index i of the nonterminals of a group over length m into their lengths and own indices."""
+    spec, rows, lo = tables.spec, tables.rows, tables.spec.lo
+    lengths, indices = [], []
+    for suffix in group.suffixes:
+        first, rest = suffix[0], spec.rest(suffix)
+        for k in range(lo[first], m - lo[rest] + 1):
+            c = rows[first][k] * rows[rest][m - k]
+            if i < c:
+                break
+            i -= c
+        a, i = divmod(i, rows[rest][m - k])
+        lengths.append(k)
+        indices.append(a)
+        m -= k
+    lengths.append(m)
+    indices.append(i)
+    return lengths, indices
+
+def unrank(tables, index, n, symbol=None):
+    """
+    The structure of length n with a given index among those derived from symbol.
+    Derivations are ordered by rule group, then rule, then nonterminal lengths (shortest
+    first nonterminal first), then the indices of the nonterminals, the first one most
+    significant. Uses an explicit stack, so deep structures need no recursion.
+    Inputs:
+        tables: ExactTables - Tables covering length n
+        index: int - Index in [0, tables.count(n, symbol))
+        n: int - Length of the structure
+        symbol: str or None - Nonterminal to derive (spec.start by default)
+    Outputs:
+        str - Dot-bracket structure
+    """
+    spec = tables.spec
+    symbol = symbol or spec.start
+    if not 0 <= index < tables.count(n, symbol):
+        raise IndexError(f"Index {index} out of range for {tables.count(n, symbol)} structures of length {n}")
+    out = bytearray(n)
+    stack = [(symbol, 0, n, index)]
+    while stack:
+        symbol, pos, n, i = stack.pop()
+        for group, w in zip(spec.groups[symbol], tables.group_weights[symbol]):
+            sub = tables.group_count(group, n)
+            if i < w * sub:
+                break
+            i -= w * sub
+        r, i = divmod(i, sub)
+        for rule in group.rules:
+            r -= int(rule.weight)
+            if r < 0:
+                break
+        lengths, indices = _unrank_sequence(tables, group, n - group.fixed, i) if group.nts else ([], [])
+        children = iter(zip(lengths, indices))
+        pending = []
+        for is_nt, item in rule.layout:
+            if is_nt:
+                k, a = next(children)
+                pending.append((item, pos, k, a))
+                pos += k
+            else:
+                out[pos:pos + len(item)] = item
+                pos += len(item)
+        stack.extend(reversed(pending))
+    return out.decode()
+
+def rank(tables, structure, parse, symbol=None):
+    """
+    Index of a structure among those of its length derived from symbol (inverse of unrank).
+    Inputs:
+        tables: ExactTables - Tables covering len(structure)
+        structure: str - Dot-bracket structure
+        parse: callable - (structure, symbol, pos, n) -> (rule, nonterminal lengths) for the rule
+            deriving structure[pos:pos+n] from symbol, or None if no rule does
+        symbol: str or None - Nonterminal to derive (spec.start by default)
+    Outputs:
+        int - Index in [0, tables.count(len(structure), symbol))
+    """
+    spec, rows, lo = tables.spec, tables.rows, tables.spec.lo
+    index = 0
+    # Every index is linear in the indices of its nonterminals, so each node adds its own offset times a multiplier
+    stack = [(symbol or spec.start, 0, len(structure), 1)]
+    while stack:
+        symbol, pos, n, mult = stack.pop()
+        parsed = parse(structure, symbol, pos, n)
+        if parsed is None or tables.count(n, symbol) == 0:
+            raise ValueError(f"{structure!r} is not derived by the grammar")
+        rule, lengths = parsed
+        gi, offset = tables.rule_offsets[rule]
+        groups = spec.groups[symbol]
+        const = sum(w * tables.group_count(group, n) for group, w in zip(groups[:gi], tables.group_weights[symbol]))
+        group = groups[gi]
+        const += offset * tables.group_count(group, n)
+        m = n - group.fixed
+        mults = []
+        for suffix, k in zip(group.suffixes, lengths):
+            first, rest = suffix[0], spec.rest(suffix)
+            const += sum(rows[first][j] * rows[rest][m - j] for j in range(lo[first], k))
+            mults.append(rows[rest][m - k])
+            m -= k
+        mults.append(1)
+        index += mult * const
+        children = iter(zip(lengths, mults))
+        for is_nt, item in rule.layout:
+            if is_nt:
+                k, child_mult = next(children)
+                stack.append((item, pos, k, mult * child_mult))
+                pos += k
+            else:
+                pos += len(item)
+    return index
+
+def enumerate_structures(tables, n, symbol=None, start=0):
+    """
+    Lazily yields every structure of length n derived from symbol, in unrank order,
+    starting at index `start` (earlier subtrees are skipped with the counts, not walked).
+    Derivations are filled into one shared buffer and only the part of the structure that
+    changes between two neighbours is rewritten, so memory stays O(n) whatever the count.
+    Inputs:
+        tables: ExactTables - Tables covering length n
+        n: int - Length of the structures
+        symbol: str or None - Nonterminal to derive (spec.start by default)
+        start: int - Index of the first structure
+    Outputs:
+        iterator of str - Structures unrank(start), unrank(start + 1), ...
+    """
+    symbol = symbol or tables.spec.start
+    if 0 <= start < tables.count(n, symbol):
+        out = bytearray(n)
+        for _ in _fill(tables, out, symbol, 0, n, start):
+            yield out.decode()
+
+def _fill(tables, out, symbol, pos, n, skip):
+    """Writes the derivations of symbol into out[pos:pos+n] one after the other, from index skip on, yielding after each."""
+    spec = tables.spec
+    groups, weights = spec.groups[symbol], tables.group_weights[symbol]
+    run = spec.run.get(symbol)
+    if run is None or run.weight != 1:
+        unit, order = b"", [(0, gi) for gi in range(len(groups))]
+    else:
+        # Unrolled N -> t N: the derivations of N(n) are the groups before the run rule, then
+        # t N(n - |t|), then the groups after it, which orders the runs of leading t as below
+        ri = groups.index(run)
+        unit = run.rules[0].layout[0][1]
+        max_runs = (n - spec.min_len[symbol]) // len(unit)
+        order = [(runs, gi) for runs in range(max_runs + 1) for gi in range(ri)]
+        order += [(runs, gi) for runs in range(max_runs, -1, -1) for gi in range(ri + 1, len(groups))]
+    for runs, gi in order:
+        group, w = groups[gi], weights[gi]
+        start = pos + runs * len(unit)
+        m = pos + n - start
+        sub = tables.group_count(group, m)
+        if skip >= w * sub:
+            skip -= w * sub
+            continue
+        out[pos:start] = unit * runs
+        copy, skip = divmod(skip, sub)
+        for rule in group.rules:
+            copies = int(rule.weight)
+            if copy >= copies:
+                copy -= copies
+                continue
+            for _ in range(copy, copies):
+                yield from _fill_layout(tables, out, rule.layout, start, m - group.fixed, group.suffixes, skip)
+                skip = 0
+            copy = 0
+
+def _fill_layout(tables, out, layout, pos, m, suffixes, skip):
+    """
+    Fills the rest of a rule from out[pos] on: `layout` holds its remaining items and
+    its nonterminals share length m. Yields once per derivation, from index skip on.
+    """
+    i = 0
+    while i < len(layout) and not layout[i][0]:
+        item = layout[i][1]
+        out[pos:pos + len(item)] = item
+        pos += len(item)
+        i += 1
+    if i == len(layout):
+        yield
+        return
+    first, tail = layout[i][1], layout[i + 1:]
+    rows = tables.rows
+    if not suffixes:
+        # Last nonterminal: only terminals follow it
+        end = pos + m
+        for _, item in tail:
+            out[end:end + len(item)] = item
+            end += len(item)
+        if rows[first][m] == 1:
+            out[pos:pos + m] = _single(tables, first, m)
+            yield
+        else:
+            yield from _fill(tables, out, first, pos, m, skip)
+        return
+    spec, lo = tables.spec, tables.spec.lo
+    rest = spec.rest(suffixes[0])
+    for k in range(lo[first], m - lo[rest] + 1):
+        count_rest = rows[rest][m - k]
+        c = rows[first][k] * count_rest
+        if skip >= c:
+            skip -= c
+            continue
+        a, b = divmod(skip, count_rest)
+        if rows[first][k] == 1:
+            out[pos:pos + k] = _single(tables, first, k)
+            yield from _fill_layout(tables, out, tail, pos + k, m - k, suffixes[1:], b)
+        else:
+            for _ in _fill(tables, out, first, pos, k, a):
+                yield from _fill_layout(tables, out, tail, pos + k, m - k, suffixes[1:], b)
+                b = 0
+        skip = 0
+
+def _single(tables, symbol, n):
+    """The only derivation of symbol at length n, cached (most short subtrees have a single one)."""
+    key = (symbol, n)
+    if key not in tables.singles:
+        tables.singles[key] = unrank(tables, 0, n, symbol).encode()
+    return tables.singles[key]
+
+def decompose_helices(ss):
+    """
+    Decomposes a valid dot-bracket string into a dictionary of helices.
+    Inputs:
+        ss: str - RNA secondary structure in dot-bracket notation
+    Outputs:
+        tuple (dict, dict) - H (dict mapping helix_id to (start, end) indices) and C (dict mapping helix_id to base pair count)
+    """
+    p = []
+    res,H,C = {},{},{}
+    for i,c in enumerate(ss):
+        if c=="(":
+            p.append(i)
+        elif c== ")":
+            j = p.pop()
+            a,b = j,i
+            ii,jj = a+1,b-1
+            if (ii,jj) in res:
+                hid = res[(ii,jj)]
+                res[(a,b)] = hid
+                C[hid] += 1
+            else:
+                hid = 1+len(H)
+                res[(a,b)] = hid
+                H[hid] = (a,b)
+                C[hid] = 1
+    return H,C
@@ -0,0 +1,67 @@
+import json
+import sys
+
+# Long-lived NUPACK design worker, started by benchmark_tools.NupackPool with the
+# Python that has nupack installed. nupack is imported once; jobs then arrive on
+# stdin as one JSON object per line ({"structure": ...}) and every job gets one
+# JSON line back on stdout ({"seq": ... or null}).
+
+def design(nupack, model, structure):
+    """
+    Runs NUPACK 4.0 Design on a dot-bracket structure.
+    Outputs:
+        str or None - Designed sequence
+    """
+    domain = nupack.Domain("N" * len(structure), name="d1")
+    strand = nupack.TargetStrand([domain], name="s1")
+    complex_target = nupack.TargetComplex([strand], structure, name="c1")
+    tube = nupack.TargetTube(on_targets={complex_target: 1e-6}, name="t1")
+    design = nupack.Design(tubes=[tube], model=model)
+    results = design.run(trials=1)
+    if not results:
+        return None
+
+    seq = None
+    try:
+        for d_obj, d_seq in results[0].domains.items():
+            if len(str(d_seq)) == len(structure):
+                seq = str(d_seq)
+                break
+    except Exception:
+        pass
+
+    if not seq:
+        try:
+            analysis = results[0].to_analysis()
+            for s_name in analysis.strands:
+                seq = str(analysis.strands[s_name])
+                break
+        except Exception:
+            pass
+
+    if seq and len(seq) == len(structure) and all(c in "ACGU" for c in seq):
+        return seq
+    return None
+
+def main():
+    try:
+        import nupack
+        model = nupack.Model(material="rna")
+    except Exception as e:
+        print(json.dumps({"ready": False, "error": str(e)}), flush=True)
+        return
+    print(json.dumps({"ready": True}), flush=True)
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            seq = design(nupack, model, json.loads(line)["structure"])
+            reply = {"seq": seq}
+        except Exception as e:
+            print("NUPACK_ERROR:", e, file=sys.stderr, flush=True)
+            reply = {"seq": None, "error": str(e)}
+        print(json.dumps(reply), flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+from operator import mul
+
+# NumPy is optional: the "python" backend works with plain lists.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BACKENDS = ("python", "numpy")
+DEFAULT_BACKEND = "numpy" if np is not None else "python"
+
+def check_backend(backend):
+    """
+    Validates a backend name.
+    Inputs:
+        backend: str - "python" or "numpy"
+    Outputs:
+        str - The backend name
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown table backend '{backend}', expected one of {BACKENDS}")
+    if backend == "numpy" and np is None:
+        raise ImportError("The numpy table backend was requested but numpy is not installed")
+    return backend
+
+def grow(row, size, backend):
+    """
+    Pads a table row with zeros up to `size` entries.
+    Inputs:
+        row: list or numpy.ndarray - Existing row
+        size: int - Required number of entries
+        backend: str - "python" or "numpy"
+    Outputs:
+        list or numpy.ndarray - The padded row (lists are padded in place)
+    """
+    if len(row) >= size:
+        return row
+    if backend == "numpy":
+        out = np.zeros(size)
+        out[:len(row)] = row
+        return out
+    row.extend([0.0] * (size - len(row)))
+    return row
+
+def new_block(levels, backend):
+    """Returns an empty block of `levels` rows (one contiguous 2-D array for numpy)."""
+    return np.zeros((levels, 0)) if backend == "numpy" else [[] for _ in range(levels)]
+
+def copy_block(block, backend):
+    """Returns a copy of a block that shares no row with it."""
+    return np.array(block) if backend == "numpy" else [list(row) for row in block]
+
+def grow_block(block, size, backend):
+    """
+    Pads every row of a block with zeros up to `size` entries.
+    Outputs:
+        list of list or numpy.ndarray - The padded block (lists are padded in place)
+    """
+    if backend == "numpy":
+        block = np.asarray(block)
+        if block.shape[1] >= size:
+            return block
+        out = np.zeros((block.shape[0], size))
+        out[:, :block.shape[1]] = block
+        return out
+    return [grow(row, size, backend) for row in block]
+
+def conv(A, B, n, lo_a, lo_b):
+    """
+    One coefficient of the convolution of two rows: sum_{k=lo_a}^{n-lo_b} A[k] * B[n-k].
+    Computed as a single dot product of slices (numpy.dot for arrays).
+    Inputs:
+        A, B: list or numpy.ndarray - Table rows
+        n: int - Total length split between A and B
+        lo_a, lo_b: int - Minimum length given to A / B
+    Outputs:
+        float - The sum (0.0 if the range is empty)
+    """
+    hi = n - lo_b
+    if hi < lo_a:
+        return 0.0
+    a = A[lo_a:hi + 1]
+    b = B[lo_b:n - lo_a + 1]
+    if isinstance(a, list):
+        return sum(map(mul, a, reversed(b)))
+    return float(np.dot(a, b[::-1]))
+
+def rescale(row, n, f):
+    """
+    Multiplies row[i] by f**i for every computed entry i <= n.
+    """
+    if isinstance(row, list):
+        for i in range(n + 1):
+            row[i] *= f**i
+    else:
+        row[:n + 1] *= f ** np.arange(n + 1)
+
+def conv_block(A, block, n, lo_a):
+    """
+    conv(A, row, n, lo_a, 0) for every row of a block, as one matrix-vector product for arrays.
+    Outputs:
+        list or numpy.ndarray - One coefficient per row
+    """
+    if isinstance(block, list):
+        return [conv(A, row, n, lo_a, 0) for row in block]
+    if n < lo_a:
+        return np.zeros(block.shape[0])
+    return block[:, n - lo_a::-1] @ A[lo_a:n + 1]
+
+def conv_counts(A, B, n, lo_a, lo_b, K):
+    """
+    Convolution of two count blocks (rows 0..K, row K saturating):
+    out[min(i+j, K)] += conv(A[i], B[j], n, lo_a, lo_b).
+    For arrays every (i, j) dot product comes from one matrix product.
+    Outputs:
+        list or numpy.ndarray - K + 1 coefficients
+    """
+    if isinstance(A, list):
+        out = [0.0] * (K + 1)
+        for i in range(K + 1):
+            for j in range(K + 1):
+                out[min(i + j, K)] += conv(A[i], B[j], n, lo_a, lo_b)
+        return out
+    hi = n - lo_b
+    if hi < lo_a:
+        return np.zeros(K + 1)
+    products = A[:, lo_a:hi + 1] @ B[:, lo_b:n - lo_a + 1][:, ::-1].T
+    counts = np.arange(K + 1)
+    return np.bincount(np.minimum(np.add.outer(counts, counts), K).ravel(), products.ravel(), K + 1)
+
+# Pairs summed term by term at once by log_conv_counts, bounded so that the terms fit in memory
+TERMWISE_TERMS = 1 << 22
+
+def _tilted_sums(X, Y, shift):
+    """
+    Log of the sums over m of exp(X[i][m] + Y[j][m]) from one matrix product of the rows
+    tilted by -shift / +shift and shifted by their maxima, with the mask of the sums that
+    kept their largest terms (the others are too small for float range that way).
+    """
+    Xc, Yc = X - shift, Y + shift
+    top_a, top_b = Xc.max(axis=1), Yc.max(axis=1)
+    Xc -= top_a[:, None]
+    Yc -= top_b[:, None]
+    products = np.exp(Xc, out=Xc) @ np.exp(Yc, out=Yc).T
+    return np.log(products) + top_a[:, None] + top_b[None, :], products >= 1e-280
+
+def _termwise_sums(X, Y):
+    """Log of the sum over m of exp(X[r][m] + Y[r][m]) for every row r, term by term."""
+    terms = X + Y
+    top = terms.max(axis=1)
+    safe = np.where(np.isfinite(top), top, 0.0)
+    return safe + np.log(np.exp(terms - safe[:, None]).sum(axis=1))
+
+def log_conv_counts(A, B, n, lo_a, lo_b, K):
+    """
+    conv_counts for blocks of natural logs (numpy only, -inf for 0):
+    out[min(i+j, K)] = log of the sum over m of exp(A[i][m] + B[j][n-m]).
+    Every (i, j) sum comes from one matrix product of the exponentiated rows, each
+    row tilted by the growth rate of A per position (the log form of the per-length
+    scale of the float tables; the tilts cancel in every term) and shifted by its
+    maximum. A sum of at least 1e-280 has kept its largest terms at full precision.
+    The pairs below that, whose rows peak too far apart for one tilt (counts far
+    from the typical one for their length, extreme weight ratios), are summed term
+    by term by _termwise_sums, so every output keeps full relative precision.
+    Outputs:
+        numpy.ndarray - K + 1 log coefficients
+    """
+    out = np.full(K + 1, -np.inf)
+    hi = n - lo_b
+    if hi < lo_a:
+        return out
+    X = A[:, lo_a:hi + 1]
+    Y = B[:, lo_b:n - lo_a + 1][:, ::-1]
+    finite_a, finite_b = np.isfinite(X), np.isfinite(Y)
+    rows_a = np.flatnonzero(finite_a.any(axis=1))
+    rows_b = np.flatnonzero(finite_b.any(axis=1))
+    if not len(rows_a) or not len(rows_b):
+        return out
+    X, Y, finite_a, finite_b = X[rows_a], Y[rows_b], finite_a[rows_a], finite_b[rows_b]
+    # Only pairs whose finite spans overlap have a term
+    last = X.shape[1] - 1
+    first_a = finite_a.argmax(axis=1)
+    overlap = (np.maximum.outer(first_a, finite_b.argmax(axis=1))
+               <= np.minimum.outer(last - finite_a[:, ::-1].argmax(axis=1), last - finite_b[:, ::-1].argmax(axis=1)))
+    # Growth rate of the largest entry of A per position: tilting by about it levels the rows
+    envelope, start = X.max(axis=0), first_a.min()
+    growth = (envelope[-1] - envelope[start]) / (last - start) if last > start else 0.0
+    with np.errstate(divide="ignore", under="ignore", invalid="ignore"):
+        logs, kept = _tilted_sums(X, Y, growth * np.arange(X.shape[1]))
+        logs[~overlap] = -np.inf
+        i, j = np.nonzero(overlap & ~kept)
+        step = max(TERMWISE_TERMS // X.shape[1], 1)
+        for s in range(0, len(i), step):
+            logs[i[s:s + step], j[s:s + step]] = _termwise_sums(X[i[s:s + step]], Y[j[s:s + step]])
+
+        counts = np.minimum(np.add.outer(rows_a, rows_b), K).ravel()
+        logs = logs.ravel()
+        np.maximum.at(out, counts, logs)
+        top = np.where(np.isfinite(out), out, 0.0)
+        return top + np.log(np.bincount(counts, np.exp(logs - top[counts]), K + 1))
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+from array import array
+
+from table_backends import np
+
+HEADER_BYTES = 3 * 8
+
+def table_key(tables):
+    """
+    Content hash of the grammar spec behind `tables` (not of their length).
+    Outputs:
+        str - Hex digest
+    """
+    blob = json.dumps({"spec": tables.spec.key(), "scaled": tables.scaled,
+                       "row_height": tables.row_height()}, sort_keys=True).encode()
+    return hashlib.sha256(blob).hexdigest()
+
+class TableStore:
+    """
+    Content-addressed on-disk cache of GrammarTables.
+    Tables are keyed by a hash of their grammar spec (rules, weights, minimum
+    lengths, product rows) and row layout but not by length: the stored tables for
+    L=1000 answer any L' <= 1000, and a longer request extends and replaces them.
+    Each entry is a single raw float64 file: a 3-value header (L, number of rows,
+    scale) followed by the rows, replaced atomically so concurrent processes never
+    see a partial entry. Rows are memory-mapped for the numpy backend.
+    Least recently used entries are deleted once the directory exceeds `max_bytes`.
+    Attributes:
+        directory: str - Cache directory
+        max_bytes: int - Size budget for the stored rows
+    """
+    def __init__(self, directory="output/table_cache", max_bytes=512 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, tables):
+        """
+        Content hash of the grammar spec behind `tables`.
+        Outputs:
+            str - Hex digest used as file name
+        """
+        return table_key(tables)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def load(self, tables, L):
+        """
+        Fills an empty GrammarTables from the store.
+        Inputs:
+            tables: GrammarTables - Freshly constructed tables (no rows yet)
+            L: int - Length the caller needs
+        Outputs:
+            bool - True if stored rows were loaded (they may cover less than L)
+        """
+        path = self._path(self.key(tables))
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header = array("d")
+                header.frombytes(mm[:HEADER_BYTES])
+                L, n_rows, scale = int(header[0]), int(header[1]), header[2]
+                size = L + 1
+                if n_rows != len(tables.block):
+                    return False
+                if tables.backend == "numpy":
+                    block = np.memmap(path, dtype="<f8", mode="c", offset=HEADER_BYTES, shape=(n_rows, size))
+                else:
+                    block = []
+                    for i in range(n_rows):
+                        start = HEADER_BYTES + i * size * 8
+                        row = array("d")
+                        row.frombytes(mm[start:start + size * 8])
+                        block.append(row.tolist())
+        except (OSError, ValueError):
+            return False
+        tables.block = block
+        tables._bind_rows()
+        tables.L = L
+        tables.scale = scale
+        # Rule weights and cached cdfs depend on the scale
+        tables._set_rule_weights()
+        tables._cdf.clear()
+        os.utime(path)
+        return True
+
+    def save(self, tables):
+        """
+        Writes `tables` to the store (atomically) and evicts old entries if needed.
+        """
+        key = self.key(tables)
+        path = self._path(key)
+        rows = tables.block
+        size = tables.L + 1
+        tmp = path + f".{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(array("d", [tables.L, len(rows), tables.scale]).tobytes())
+            for row in rows:
+                f.write(array("d", map(float, row[:size])).tobytes())
+        os.replace(tmp, path)
+        self.evict(keep=key)
+
+    def get(self, tables, L):
+        """
+        Returns `tables` covering length L, loading it from the store when possible.
+        Tables that had to be built or extended are saved back.
+        Inputs:
+            tables: GrammarTables - Freshly constructed tables (no rows yet)
+            L: int - Required length
+        Outputs:
+            GrammarTables - The same object, with tables.L >= L
+        """
+        if self.load(tables, L) and tables.L >= L:
+            return tables
+        tables.extend(L)
+        self.save(tables)
+        return tables
+
+    def evict(self, keep=None):
+        """
+        Deletes least recently used entries until the stored rows fit in max_bytes.
+        Inputs:
+            keep: str or None - Key that must not be evicted
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name[:-4]))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            total -= size
+
+class TableCache:
+    """
+    In-process cache of GrammarTables, shared by every call with the same grammar.
+    A request for a longer L extends a copy of the cached tables, computing only
+    the new rows, and replaces the cached entry with it, so a sweep over increasing
+    lengths (L=50..1000) costs about one build at the largest length. Tables handed
+    out are never modified afterwards, so threads can keep sampling from them while
+    another thread asks for a longer L. Can be passed wherever a TableStore is accepted.
+    Attributes:
+        store: TableStore or None - On-disk store behind the cache (read on a miss, written after an extension)
+        tables: dict - (tables class, backend, key) -> GrammarTables
+    """
+    def __init__(self, store=None):
+        self.store = store
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, tables, L):
+        """
+        Returns the cached tables of the grammar of `tables`, extended to cover length L.
+        Inputs:
+            tables: GrammarTables - Freshly constructed tables, only used on a miss
+            L: int - Required length
+        Outputs:
+            GrammarTables - Shared tables with .L >= L (not necessarily `tables`)
+        """
+        key = (type(tables), tables.backend, table_key(tables))
+        with self._lock:
+            cached = self.tables.get(key)
+            if cached is None:
+                cached = self.store.get(tables, L) if self.store is not None else tables.extend(L)
+                self.tables[key] = cached
+            elif cached.L < L:
+                cached = cached.copy().extend(L)
+                self.tables[key] = cached
+                if self.store is not None:
+                    self.store.save(cached)
+            return cached
+
+    def clear(self):
+        with self._lock:
+            self.tables.clear()
@@ -0,0 +1,85 @@
+import itertools
+import math
+
+import pytest
+
+import generate_structures
+import grammar_engine
+import table_backends
+
+def test_rank_unrank_round_trip():
+    cache = {}
+    for n in range(12):
+        for index in range(generate_structures.count_structures(n, cache, 2, 1)):
+            structure = generate_structures.unrank(index, n, cache, 2, 1)
+            assert generate_structures.rank(structure, cache, 2, 1) == index
+
+def test_rank_rejects_everything_the_grammar_cannot_derive():
+    cache = {}
+    n, h, theta = 8, 2, 1
+    ranked = set()
+    for chars in itertools.product(".()", repeat=n):
+        structure = "".join(chars)
+        try:
+            ranked.add(generate_structures.rank(structure, cache, h, theta))
+        except ValueError:
+            continue
+    assert ranked == set(range(generate_structures.count_structures(n, cache, h, theta)))
+
+def test_rank_helix_shorter_than_h():
+    with pytest.raises(ValueError):
+        generate_structures.rank("..()((..))()", {}, 2, 1)
+    with pytest.raises(ValueError):
+        generate_structures.rank("(((...)).)", {}, 3, 1)
+
+def test_rank_loop_shorter_than_theta():
+    with pytest.raises(ValueError):
+        generate_structures.rank("((..))", {}, 2, 3)
+    with pytest.raises(ValueError):
+        generate_structures.rank("((...))((.))", {}, 2, 3)
+
+def test_parametric_tables_match_exact_counts_at_large_length():
+    # Length 1001 with h = 1 is where a single scale per length used to underflow the low helix counts
+    h, theta, L = 1, 3, 1001
+    tables = generate_structures.ParametricTables(h, theta, L)
+    assert tables.log_counts[0, L] == 0.0
+    for wu, ws in [(50, 1), (1, 1), (1, 1000), (3, 7)]:
+        exact = grammar_engine.ExactTables(generate_structures.grammar_spec(wu, ws, h, theta)).extend(L).count(L)
+        assert tables.log_weight(L, wu, ws) == pytest.approx(math.log(exact), rel=1e-12)
+
+def _log_fsum(terms):
+    terms = [t for t in terms if t != -math.inf]
+    if not terms:
+        return -math.inf
+    top = max(terms)
+    return top + math.log(math.fsum(math.exp(t - top) for t in terms))
+
+@pytest.mark.parametrize("wu, ws", [(1e-30, 1.0), (1e-100, 1e100)])
+def test_log_count_tables_match_fsum_at_extreme_weight_ratios(monkeypatch, wu, ws):
+    termwise = []
+    real = table_backends._termwise_sums
+    def counted(X, Y):
+        termwise.append(len(X))
+        return real(X, Y)
+    monkeypatch.setattr(table_backends, "_termwise_sums", counted)
+    h, theta, L = 1, 3, 40
+    K = L // (2 * h) + 1
+    tables = grammar_engine.LogCountTables(generate_structures.grammar_spec(wu, ws, h, theta), K).extend(L)
+    # These weights put some pairs out of reach of the tilted matrix product
+    assert termwise
+    spec = tables.spec
+    for p in spec.products:
+        rest = spec.rest(p)
+        A, B = tables.rows[p[0]], tables.rows[rest]
+        for n in range(L + 1):
+            terms = [[] for _ in range(K + 1)]
+            for i in range(K + 1):
+                for j in range(K + 1):
+                    for m in range(spec.lo[p[0]], n - spec.lo[rest] + 1):
+                        terms[min(i + j, K)].append(A[i, m] + B[j, n - m])
+            for k in range(K + 1):
+                expected = _log_fsum(terms[k])
+                if expected == -math.inf:
+                    assert tables.rows[p][k, n] == -math.inf
+                else:
+                    assert tables.rows[p][k, n] == pytest.approx(expected, rel=1e-12)
@@ -0,0 +1,118 @@
+import random
+from functools import lru_cache
+
+import pytest
+
+import generate_structures
+import generate_with_motif
+import generate_with_motives
+import generate_with_starred_motif
+import grammar_engine
+
+MOTIFS = ["((*))", "(*.*)", ".*(*)*."]
+WEIGHTS = {"wu": 1.3, "ws": 0.7, "wm": 2.0}
+
+def reference_counts(kind, wu, ws, wm, h, theta, motifs=()):
+    """
+    countS / countT as the generators defined them recursively before the grammar engine.
+    kind is "structures", "motif", "starred_motif" or "motives".
+    """
+    plain = kind == "structures"
+    w_helix = ws if plain else ws**max(0, h-1)
+    w_double = ws * ws if plain else ws**(2 * max(0, h-1))
+
+    @lru_cache(maxsize=None)
+    def S(n):
+        if n == 0:
+            return 1.0
+        val = wu * S(n-1)
+        for k in range(theta, n - 2*h + 1):
+            val += w_helix * T(k) * S(n - 2*h - k)
+        return val
+
+    @lru_cache(maxsize=None)
+    def T(n):
+        if n < theta:
+            return 0.0
+        val = wu * S(n-1) if n >= 1 else 0.0
+        for k in range(theta, n - 2*h):
+            val += w_helix * T(k) * wu * S(n - 2*h - k - 1)
+        for k1 in range(theta, n - 4*h - theta + 1):
+            for k2 in range(theta, n - 4*h - k1 + 1):
+                val += w_double * T(k1) * T(k2) * S(n - 4*h - k1 - k2)
+        if not plain:
+            if n >= 2 + theta:
+                val += ws * T(n-2)
+            if n == theta:
+                val += wu**theta
+        if kind == "motif" and n >= 12:
+            val += wm * S(n - 12)
+        if kind == "starred_motif":
+            for k in range(theta, n - 11 + 1):
+                val += wm * T(k) * S(n - 11 - k)
+        if kind == "motives":
+            for motif in motifs:
+                stars = motif.count("*")
+                fixed = len(motif) - stars
+                for k in range(fixed + stars * theta, n + 1):
+                    val += wm * T_stars(stars, k - fixed) * S(n - k)
+        return val
+
+    @lru_cache(maxsize=None)
+    def T_stars(s, n):
+        if s == 0:
+            return 1.0 if n == 0 else 0.0
+        return sum(T(k) * T_stars(s-1, n-k) for k in range(theta, n - (s-1)*theta + 1))
+
+    return S, T
+
+def generators():
+    """(kind, module, weight args, extra args) of the four generators."""
+    wu, ws, wm = WEIGHTS["wu"], WEIGHTS["ws"], WEIGHTS["wm"]
+    return [
+        ("structures", generate_structures, (wu, ws), ()),
+        ("motif", generate_with_motif, (wu, ws, wm), ()),
+        ("starred_motif", generate_with_starred_motif, (wu, ws, wm), ()),
+        ("motives", generate_with_motives, (wu, ws, wm), (MOTIFS,)),
+    ]
+
+@pytest.mark.parametrize("h, theta", [(1, 0), (2, 1), (3, 3)])
+def test_counts_match_recursive_definitions(h, theta):
+    for kind, module, weights, extra in generators():
+        S, T = reference_counts(kind, **WEIGHTS, h=h, theta=theta, motifs=MOTIFS)
+        cache = {}
+        for n in range(26):
+            assert module.countS(n, cache, *weights, h, theta, *extra) == pytest.approx(S(n), rel=1e-9), (kind, n)
+            assert module.countT(n, cache, *weights, h, theta, *extra) == pytest.approx(T(n), rel=1e-9), (kind, n)
+
+def balanced(structure):
+    depth = 0
+    for c in structure:
+        depth += {"(": 1, ")": -1, ".": 0}[c]
+        if depth < 0:
+            return False
+    return depth == 0
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_samplers_write_valid_structures(backend):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    h, theta, L = 2, 3, 60
+    rng = random.Random(7)
+    for kind, module, weights, extra in generators():
+        tables = module.build_tables(L, *weights, h, theta, *extra, backend=backend)
+        out = bytearray(b"#" * (3 * L))
+        for n in range(1, L + 1):
+            if tables.S[n] <= 0:
+                assert grammar_engine.sample_structure(tables, n, rng=rng) is None
+                continue
+            for _ in range(5):
+                structure = grammar_engine.sample_structure(tables, n, rng=rng)
+                assert len(structure) == n and balanced(structure), (kind, structure)
+                if kind == "structures":
+                    generate_structures.rank(structure, {}, h, theta)
+            grammar_engine.write_structure(tables, out, L, n, rng=rng)
+            written = out[L:L + n].decode()
+            assert balanced(written), (kind, written)
+            assert out[:L] == b"#" * L and out[L + n:] == b"#" * (2 * L - n)
+            out[L:L + n] = b"#" * n
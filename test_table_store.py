@@ -0,0 +1,14 @@
+import generate_structures
+from table_store import TableCache
+
+def test_table_cache_extends_a_copy():
+    cache = TableCache()
+    short = generate_structures.build_tables(40, 1.0, 50.0, 2, 1, store=cache)
+    rows, scale = list(short.S), short.scale
+    longer = generate_structures.build_tables(400, 1.0, 50.0, 2, 1, store=cache)
+    assert longer is not short
+    assert (short.L, list(short.S), short.scale) == (40, rows, scale)
+    assert generate_structures.build_tables(100, 1.0, 50.0, 2, 1, store=cache) is longer
+    fresh = generate_structures.build_tables(400, 1.0, 50.0, 2, 1)
+    for n in range(1, 401):
+        assert longer.log_weight(n) == fresh.log_weight(n)
@@ -1,73 +1,23 @@
-import subprocess
 import argparse
 import sys
 import os
 
+import benchmark_tools
+
 def run_rnainverse(structure, timeout_sec=10):
     """
-    Runs RNAinverse on a dot-bracket structure.
+    Runs one plain RNAinverse search on a dot-bracket structure (its best sequence,
+    exact or not), through the persistent RNAinverse processes of benchmark_tools.
     Returns (sequence, success).
     """
-    try:
-        process = subprocess.Popen(
-            ['RNAinverse'],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        try:
-            stdout, stderr = process.communicate(input=structure + "\n", timeout=timeout_sec)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.communicate()
-            return None, False
-        if process.returncode != 0:
-            return None, False
-        lines = stdout.strip().split('\n')
-        if not lines or not lines[0]:
-            return None, False
-        parts = lines[0].split()
-        if len(parts) >= 1:
-            sequence = parts[0]
-            if len(sequence) == len(structure) and all(c in 'ACGU' for c in sequence):
-                return sequence, True
-        return None, False
-    except Exception as e:
-        print(f"  [Error in RNAinverse]: {e}")
-        return None, False
+    return benchmark_tools.run_rnainverse_search(structure, timeout_sec)
 
 def run_rnafold(sequence, timeout_sec=5):
     """
-    Runs RNAfold on a sequence.
+    Runs RNAfold on a sequence (benchmark_tools: ViennaRNA bindings or persistent RNAfold).
     Returns (mfe_structure, success).
     """
-    try:
-        process = subprocess.Popen(
-            ['RNAfold', '--noPS'],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        try:
-            stdout, stderr = process.communicate(input=sequence + "\n", timeout=timeout_sec)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.communicate()
-            return None, False
-        if process.returncode != 0:
-            return None, False
-        lines = stdout.strip().split('\n')
-        if len(lines) >= 2:
-            # RNAfold output: line 1 = sequence, line 2 = "structure (energy)"
-            fold_line = lines[1].split()
-            if len(fold_line) >= 1:
-                return fold_line[0], True
-        return None, False
-    except Exception as e:
-        print(f"  [Error in RNAfold]: {e}")
-        return None, False
+    return benchmark_tools.run_rnafold(sequence, timeout_sec)
 
 def verify_file(filepath, max_structures=10):
     if not os.path.exists(filepath):